@@ -1,35 +1,241 @@
 import os
-from flask import Flask, request, render_template, jsonify
-from PIL import Image
-from google import genai
-from google.genai.types import Tool
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from flask import Flask, request, render_template, jsonify, Response, send_file, stream_with_context
 from dotenv import load_dotenv
-import requests
-from services.detailed_analysis import get_detailed_analysis
-from services.revenue_analysis import get_revenue_segments
-from services.persona_generator import generate_personas
-from services.cache_service import CacheService
+from services.analysis_pipeline import run_pipeline
+from services.segment_parser import parse_segments
+from services.persona_generator import FAILURE_PREFIXES, persona_failed, regenerate_segment
+from services.cache_service import CacheService, COLUMNS, HEAVY_COLUMNS
+from services.llm_cache import CachedClient, create_backend
+from services.job_queue import JobQueue
+from services.batch_runner import claim_output, load_products, run_batch
+from services.fetcher import Fetcher
+from services.html_extractor import extract_page_content
+from services.image_processor import preprocess_image
+from services import metrics
+from services.gemini_client import GovernedClient, LazyClient
+from services.similarity_index import SimilarityIndex
+from services.prompts import PROMPT_VERSION
 
 # Load environment variables
 load_dotenv()
 
-# Configure Google Gemini API
-client = genai.Client(api_key=os.getenv('GOOGLE_API_KEY'))
+# Under a multi-process server, /metrics sums every worker's values through files in this directory
+METRICS_DIR = os.getenv('METRICS_DIR')
+if METRICS_DIR:
+    metrics.configure_multiprocess(METRICS_DIR)
+
+def _create_gemini_client():
+    from google import genai
+    return genai.Client(api_key=os.getenv('GOOGLE_API_KEY'))
+
+# Configure Google Gemini API on first use, recording latency, sizes and token usage of every call
+client = metrics.InstrumentedClient(LazyClient(_create_gemini_client))
+
+# Server processes sharing the API quota (set by gunicorn.conf.py); each one governs its share
+SERVER_WORKERS = max(1, int(os.getenv('SERVER_WORKERS', '1')))
+
+def _per_worker(limit):
+    """Split an API-wide limit between server processes, keeping 0 as 'off'."""
+    return max(1, limit // SERVER_WORKERS) if limit else 0
+
+# Shared quota governor: rate limits, in-flight cap, retries with backoff and a circuit breaker
+client = GovernedClient(
+    client,
+    requests_per_minute=_per_worker(int(os.getenv('GEMINI_RPM', '0'))),
+    tokens_per_minute=_per_worker(int(os.getenv('GEMINI_TPM', '0'))),
+    max_in_flight=_per_worker(int(os.getenv('GEMINI_MAX_IN_FLIGHT', '8'))),
+    max_retries=int(os.getenv('GEMINI_MAX_RETRIES', '3')),
+    failure_threshold=int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5')),
+    cooldown=float(os.getenv('GEMINI_BREAKER_COOLDOWN', '30'))
+)
+
+# Memoize identical model calls (same model, prompt, tools and image bytes) per prompt version
+llm_cache_backend = create_backend(
+    kind=os.getenv('LLM_CACHE_BACKEND', 'memory'),
+    cache_dir=os.getenv('LLM_CACHE_DIR', 'cache/llm'),
+    max_bytes=int(os.getenv('LLM_CACHE_MAX_BYTES', '0')) or None,
+    ttl=int(os.getenv('LLM_CACHE_TTL', '0')) or None
+)
+if llm_cache_backend is not None:
+    client = CachedClient(client, backend=llm_cache_backend, namespace=PROMPT_VERSION)
 
 # Initialize cache service
 cache_service = CacheService()
 
+# Persona generation concurrency (segments in flight) and per-call timeout in seconds
+PERSONA_MAX_WORKERS = int(os.getenv('PERSONA_MAX_WORKERS', '4'))
+PERSONA_CALL_TIMEOUT = float(os.getenv('PERSONA_CALL_TIMEOUT', '0')) or None
+
+# Batched persona generation ('off', 'personas' or 'all') and search grounding for video prompts
+PERSONA_BATCH_MODE = os.getenv('PERSONA_BATCH_MODE', 'off')
+VIDEO_PROMPT_GROUNDING = os.getenv('VIDEO_PROMPT_GROUNDING', '1').lower() not in ('0', 'false', 'no')
+
+# Token budget for the product analysis sent with each video prompt (0 sends the full analysis)
+PRODUCT_CONTEXT_TOKENS = int(os.getenv('PRODUCT_CONTEXT_TOKENS', '400')) or None
+
+# Shared pooled HTTP client for image and website URLs
+fetcher = Fetcher(
+    connect_timeout=float(os.getenv('FETCH_CONNECT_TIMEOUT', '5')),
+    read_timeout=float(os.getenv('FETCH_READ_TIMEOUT', '15')),
+    max_seconds=float(os.getenv('FETCH_MAX_SECONDS', '30')),
+    max_bytes=int(os.getenv('FETCH_MAX_BYTES', str(10 * 1024 * 1024)))
+)
+
+# Token budget for readable text extracted from website inputs
+WEBSITE_TOKEN_BUDGET = int(os.getenv('WEBSITE_TOKEN_BUDGET', '4000'))
+
+# Uploaded images are downscaled to this longest edge and rejected above the pixel limit
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '1536'))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', '50000000'))
+
+# Near-duplicate submissions (MinHash text similarity, image hash distance in bits) reuse
+# an earlier analysis; a threshold of 0 turns the lookup off
+SIMILARITY_THRESHOLD = float(os.getenv('SIMILARITY_THRESHOLD', '0.85'))
+similarity_index = SimilarityIndex(
+    cache_service,
+    threshold=SIMILARITY_THRESHOLD,
+    max_image_distance=int(os.getenv('SIMILARITY_MAX_IMAGE_DISTANCE', '4'))
+) if SIMILARITY_THRESHOLD > 0 else None
+
+# Page sizes for GET /personas
+PERSONAS_PAGE_SIZE = int(os.getenv('PERSONAS_PAGE_SIZE', '50'))
+PERSONAS_MAX_PAGE_SIZE = int(os.getenv('PERSONAS_MAX_PAGE_SIZE', '500'))
+
+# Catalog batches: products analyzed at once per batch, and where uploads and results are kept
+BATCH_PARALLELISM = int(os.getenv('BATCH_PARALLELISM', '2'))
+BATCH_DIR = os.getenv('BATCH_DIR', 'cache/batches')
+
+# Background workers for queued analysis jobs; job status is shared with other server processes
+job_queue = JobQueue(max_workers=int(os.getenv('JOB_WORKERS', '2')), store=cache_service)
+
 app = Flask(__name__)
 
+@app.before_request
+def _start_request_timer():
+    request.environ['analysis.started'] = time.perf_counter()
+    metrics.clear_trace()
+
+@app.after_request
+def _record_request_duration(response):
+    started = request.environ.get('analysis.started')
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        # Observed once the body has been sent, so streamed responses are timed in full
+        response.call_on_close(
+            lambda: metrics.request_duration.observe(time.perf_counter() - started, endpoint=endpoint)
+        )
+    return response
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/analyze', methods=['POST'])
-def analyze_image():
-    """Handle analysis requests for both image and text inputs."""
+def _fetch_image(image_url):
+    """Download an image URL, returning (bytes, error)."""
+    try:
+        with metrics.timed_stage('fetch_image'):
+            response = fetcher.fetch(image_url)
+        if response.status_code != 200:
+            return None, f'Error fetching image: HTTP {response.status_code}'
+        return response.content, None
+    except Exception as e:
+        return None, f'Error fetching image: {str(e)}'
+
+def prepare_analysis(image_data=None, text_input=None, text_input_type='text', refresh=False, use_similar=False):
+    """Normalize analysis inputs and look them up in the store.
+
+    Returns (inputs, cached_result, error). cached_result is the stored
+    response for the same query unless refresh is set. A near-duplicate is
+    only offered as inputs['similar_to'] for the fresh result, since similar
+    texts can describe different products; use_similar=True serves its stored
+    response instead (marked with similar_to). Otherwise inputs holds
+    everything _run_pipeline needs.
+    """
+    # Validate, downscale and re-encode the image once for the whole pipeline
+    image = None
+    if image_data:
+        with metrics.timed_stage('preprocess_image'):
+            image, error = preprocess_image(image_data, max_edge=IMAGE_MAX_EDGE, max_pixels=IMAGE_MAX_PIXELS)
+        if error:
+            return None, None, error
+
+    text_input = text_input.strip() if text_input else None
+    if not image_data and not text_input:
+        return None, None, 'Please provide either an image or text description'
+
+    # Combine normalized inputs for query hash; the image is keyed on its content and
+    # the prompt version keeps results and checkpoints from older prompts from being reused
+    query_input = {
+        'image': image['content_hash'] if image else None,
+        'text': ' '.join(text_input.split()) if text_input else None,
+        'text_type': text_input_type if text_input else None,
+        'prompt_version': PROMPT_VERSION
+    }
+    query_hash = cache_service.generate_query_hash(query_input)
+
+    # Serve repeat queries from the store unless a refresh is requested
+    similar_to = None
+    if not refresh:
+        cached_result = cache_service.get_cached_result(query_hash)
+        # Website inputs are matched by URL only; their page text is not known yet
+        if not cached_result and similarity_index and query_input['text_type'] != 'url':
+            match = similarity_index.find(query_input['text'], image['perceptual_hash'] if image else None)
+            if match:
+                similar_to = {'query_hash': match[0], 'similarity': round(match[1], 3)}
+                if use_similar:
+                    cached_result = cache_service.get_cached_result(match[0])
+                    if cached_result and cached_result.get('prompt_version') != PROMPT_VERSION:
+                        cached_result = None
+        if cached_result:
+            # Results stored before structured parsing only carry the raw text
+            if 'parsed_segments' not in cached_result:
+                cached_result['parsed_segments'] = parse_segments(cached_result['segments'])
+            cached_result['cached'] = True
+            if similar_to:
+                cached_result['similar_to'] = similar_to
+            return None, cached_result, None
+    else:
+        # A refresh regenerates every stage instead of resuming from checkpoints or
+        # reusing cached model responses (see _model_client)
+        cache_service.clear_checkpoints(query_hash)
+
+    if text_input and text_input_type == 'url':
+        try:
+            with metrics.timed_stage('fetch_website'):
+                response = fetcher.fetch(text_input)
+            if response.status_code != 200:
+                return None, None, f'Error fetching website content: HTTP {response.status_code}'
+            # Send readable page content instead of raw HTML
+            with metrics.timed_stage('extract_website'):
+                text_input = extract_page_content(response.text, url=text_input, max_tokens=WEBSITE_TOKEN_BUDGET)
+        except Exception as e:
+            return None, None, f'Error fetching website content: {str(e)}'
+
+    inputs = {
+        'image_data': image['bytes'] if image else None,
+        'image_mime_type': image['mime_type'] if image else None,
+        'image_phash': image['perceptual_hash'] if image else None,
+        'text_input': text_input,
+        'query_input': query_input,
+        'query_hash': query_hash,
+        'similar_to': similar_to,
+        'refresh': refresh
+    }
+    return inputs, None, None
+
+def _parse_analysis_request():
+    """Collect the inputs for an analysis request.
+
+    Returns (inputs, cached_result, error_response); see prepare_analysis.
+    Post refresh=1 to skip the store and similar=1 to accept a near-duplicate's analysis.
+    """
     image_data = None
-    text_input = None
 
     # Handle image input
     if 'file' in request.files:
@@ -37,81 +243,334 @@ def analyze_image():
         if file.filename != '':
             image_data = file.read()
     elif 'image_url' in request.form and request.form['image_url'].strip():
+        image_data, error = _fetch_image(request.form['image_url'].strip())
+        if error:
+            return None, None, (jsonify({'error': error}), 400)
+
+    inputs, cached_result, error = prepare_analysis(
+        image_data=image_data,
+        text_input=request.form.get('text_input'),
+        text_input_type=request.form.get('text_input_type', 'text'),
+        refresh=request.form.get('refresh', '').lower() in ('1', 'true', 'yes'),
+        use_similar=request.form.get('similar', '').lower() in ('1', 'true', 'yes')
+    )
+    if error:
+        return None, None, (jsonify({'error': error}), 400)
+    return inputs, cached_result, None
+
+def _model_client(refresh=False):
+    """The API client; with refresh, responses are generated anew instead of read from the response cache."""
+    if refresh and isinstance(client, CachedClient):
+        return client.refreshing()
+    return client
+
+def _run_pipeline(inputs):
+    """Run the analysis pipeline for parsed inputs, yielding (stage, data) events."""
+    return run_pipeline(
+        image_data=inputs['image_data'],
+        image_mime_type=inputs['image_mime_type'],
+        text_input=inputs['text_input'],
+        client=_model_client(inputs['refresh']),
+        max_workers=PERSONA_MAX_WORKERS,
+        timeout=PERSONA_CALL_TIMEOUT,
+        batch_mode=PERSONA_BATCH_MODE,
+        video_grounding=VIDEO_PROMPT_GROUNDING,
+        checkpoints=cache_service,
+        fingerprint=inputs['query_hash'],
+        product_context_tokens=PRODUCT_CONTEXT_TOKENS
+    )
+
+def _store_results(inputs, detailed_analysis, segments_result, personas):
+    """Cache the pipeline output and build the response returned to the client."""
+    cached_data = cache_service.cache_analysis(
+        query_input=inputs['query_input'],
+        segments_data=segments_result,
+        personas=personas
+    )
+
+    # Return results with segment keys
+    result = {
+        'query_hash': inputs['query_hash'],
+        'segments': segments_result['segments'],
+        'parsed_segments': segments_result['parsed_segments'],
+        'personas': personas,
+        'segment_keys': {data['segment_name']: key for key, data in cached_data.items()},
+        'grounding_data': segments_result.get('grounding_data'),
+        # Kept so single segments can be regenerated later with the same product context
+        'detailed_analysis': detailed_analysis,
+        'prompt_version': PROMPT_VERSION
+    }
+    # Partial or empty results are not served to repeat queries; a retry resumes from checkpoints instead
+    complete = segments_result['parsed_segments'] and not any(persona_failed(persona) for persona in personas.values())
+    if complete:
+        cache_service.cache_result(inputs['query_hash'], result)
+        cache_service.clear_checkpoints(inputs['query_hash'])
+        if similarity_index is not None and inputs['query_input']['text_type'] != 'url':
+            similarity_index.add(inputs['query_hash'], inputs['query_input']['text'], inputs['image_phash'])
+
+    result['cached'] = False
+    if inputs.get('similar_to'):
+        # Offered only; the caller can post similar=1 to reuse it next time
+        result['similar_to'] = inputs['similar_to']
+    return result
+
+def analyze(inputs):
+    """Run the pipeline for prepared inputs and store the outcome, returning (result, error)."""
+    stages = {}
+    for stage, data in _run_pipeline(inputs):
+        if stage == 'error':
+            return None, data
+        stages[stage] = data
+    return _store_results(inputs, stages['detailed_analysis'], stages['segments'], stages['personas']), None
+
+def analyze_product(product, allow_local_images=False):
+    """Analyze one catalog product from services.batch_runner.load_products, returning (result, error).
+
+    Repeat and near-duplicate products are answered from the store like any
+    other submission. Local image paths are only read when allow_local_images
+    is set, as the command-line runner does.
+    """
+    image_data = None
+    if product.get('image'):
+        if not allow_local_images:
+            return None, 'Local image paths are only accepted by the command-line batch runner'
         try:
-            response = requests.get(request.form['image_url'])
-            image_data = response.content
-        except Exception as e:
-            return jsonify({'error': f'Error fetching image: {str(e)}'}), 400
-
-    # Handle text input
-    if 'text_input' in request.form and request.form['text_input'].strip():
-        text_input = request.form['text_input'].strip()
-        text_input_type = request.form.get('text_input_type', 'text')
-        
-        if text_input_type == 'url':
-            try:
-                response = requests.get(text_input)
-                if response.status_code != 200:
-                    return jsonify({'error': f'Error fetching website content: HTTP {response.status_code}'}), 400
-                text_input = response.text
-            except Exception as e:
-                return jsonify({'error': f'Error fetching website content: {str(e)}'}), 400
+            with open(product['image'], 'rb') as f:
+                image_data = f.read()
+        except OSError as e:
+            return None, f"Error reading image: {str(e)}"
+    elif product.get('image_url'):
+        image_data, error = _fetch_image(product['image_url'])
+        if error:
+            return None, error
 
-    if not image_data and not text_input:
-        return jsonify({'error': 'Please provide either an image or text description'}), 400
+    inputs, cached_result, error = prepare_analysis(
+        image_data=image_data,
+        text_input=product.get('text'),
+        text_input_type=product.get('text_type') or 'text'
+    )
+    if error:
+        return None, error
+    if cached_result:
+        return cached_result, None
+    return analyze(inputs)
+
+@app.route('/analyze', methods=['POST'])
+def analyze_image():
+    """Handle analysis requests for both image and text inputs.
+
+    Post timing=1 to include per-stage timings and model call details in the response.
+    """
+    trace = metrics.start_trace()
+    include_timing = request.form.get('timing', '').lower() in ('1', 'true', 'yes')
+
+    inputs, cached_result, error_response = _parse_analysis_request()
+    if error_response:
+        return error_response
+    if cached_result:
+        if include_timing:
+            cached_result['timing'] = trace.summary()
+        return jsonify(cached_result)
 
     try:
-        # Combine inputs for query hash
-        query_input = {
-            'image': bool(image_data),
-            'text': text_input
-        }
-
-        # Step 1: Get detailed analysis
-        detailed_analysis, error = get_detailed_analysis(
-            image_data=image_data,
-            text_input=text_input,
-            client=client
-        )
-        
+        result, error = analyze(inputs)
         if error:
             return jsonify({'error': error})
 
-        # Step 2: Get revenue segments
-        segments_result, error = get_revenue_segments(detailed_analysis, client)
-        
-        if error:
-            return jsonify({'error': error})
+        if include_timing:
+            result['timing'] = trace.summary()
+        return jsonify(result)
 
-        # Step 3: Generate personas for each segment
-        personas, error = generate_personas(
-            segments=segments_result['segments'],
-            product_details={'description': detailed_analysis},
-            client=client
-        )
-        
-        if error:
-            return jsonify({'error': error})
+    except Exception as e:
+        return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
 
-        # Step 4: Cache the results
-        cached_data = cache_service.cache_analysis(
-            query_input=query_input,
-            segments_data=segments_result,
-            personas=personas
-        )
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """Stream each analysis stage as newline-delimited JSON as soon as it completes."""
+    inputs, cached_result, error_response = _parse_analysis_request()
+    if error_response:
+        return error_response
 
-        # Return results with segment keys
-        result = {
-            'segments': segments_result['segments'],
-            'personas': personas,
-            'segment_keys': {name: data['segment_key'] for name, data in cached_data.items()},
-            'grounding_data': segments_result.get('grounding_data')
-        }
+    def generate():
+        if cached_result:
+            yield json.dumps({'event': 'result', **cached_result}) + '\n'
+            return
 
-        return jsonify(result)
+        try:
+            detailed_analysis = None
+            segments_result = None
+            for stage, data in _run_pipeline(inputs):
+                if stage == 'error':
+                    yield json.dumps({'event': 'error', 'error': data}) + '\n'
+                    return
+                if stage == 'detailed_analysis':
+                    detailed_analysis = data
+                    yield json.dumps({'event': stage, 'detailed_analysis': data}) + '\n'
+                elif stage == 'segments':
+                    segments_result = data
+                    yield json.dumps({'event': stage, **data}) + '\n'
+                elif stage == 'persona':
+                    yield json.dumps({'event': stage, **data}) + '\n'
+                elif stage == 'personas':
+                    result = _store_results(inputs, detailed_analysis, segments_result, data)
+                    yield json.dumps({'event': 'result', **result}) + '\n'
+
+        except Exception as e:
+            yield json.dumps({'event': 'error', 'error': f'Analysis failed: {str(e)}'}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def _analysis_job(inputs, cached_result=None):
+    """Job body for queued analyses, exposing personas as they accumulate."""
+    if cached_result:
+        yield 'result', cached_result
+        return
+
+    detailed_analysis = None
+    segments_result = None
+    completed = {}
+    for stage, data in _run_pipeline(inputs):
+        if stage == 'detailed_analysis':
+            detailed_analysis = data
+        if stage == 'segments':
+            segments_result = data
+        if stage == 'persona':
+            completed[data['segment_name']] = data['persona']
+            yield 'personas', dict(completed)
+        elif stage == 'personas':
+            yield 'result', _store_results(inputs, detailed_analysis, segments_result, data)
+        else:
+            yield stage, data
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue an analysis and return its job id without waiting for the pipeline."""
+    inputs, cached_result, error_response = _parse_analysis_request()
+    if error_response:
+        return error_response
+
+    job_id = job_queue.submit(_analysis_job, inputs, cached_result)
+    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return a job's status with any partial results produced so far."""
+    job = job_queue.get(job_id)
+    if job:
+        return jsonify(job)
+    return jsonify({'error': 'Job not found'}), 404
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running job."""
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not job_queue.cancel(job_id):
+        return jsonify({'error': 'Job already finished'}), 409
+    return jsonify(job_queue.get(job_id))
+
+def _batch_paths(batch_id):
+    batch_dir = os.path.join(BATCH_DIR, batch_id)
+    return batch_dir, os.path.join(batch_dir, 'products.jsonl'), os.path.join(batch_dir, 'results.jsonl')
+
+def _batch_job(batch_id):
+    """Job body for catalog batches, reporting progress after each product."""
+    _, products_path, results_path = _batch_paths(batch_id)
+    # Held while the run writes results, and released by the OS if the process dies
+    lock_file = claim_output(results_path)
+    if lock_file is None:
+        yield 'error', 'Another run of this batch is in progress'
+        return
+    stats = None
+    try:
+        for stats in run_batch(load_products(products_path), analyze_product, results_path, BATCH_PARALLELISM):
+            yield 'progress', stats
+    finally:
+        lock_file.close()
+    yield 'result', {'batch_id': batch_id, **stats}
+
+_batch_queue_lock = threading.Lock()
+
+def _queue_batch(batch_id):
+    """Queue a run of a batch, returning (job_id, None), or (None, active_job_id) while a run is unfinished.
 
+    A run is unfinished while its recorded job is queued, or while any run
+    (including the command-line runner) holds the results file's lock.
+    """
+    batch_dir, _, results_path = _batch_paths(batch_id)
+    job_path = os.path.join(batch_dir, 'job_id')
+    with _batch_queue_lock:
+        try:
+            with open(job_path, encoding='utf-8') as f:
+                active_job_id = f.read().strip()
+        except FileNotFoundError:
+            active_job_id = None
+        job = job_queue.get(active_job_id) if active_job_id else None
+        if job is not None and job['status'] == 'queued':
+            return None, active_job_id
+        lock_file = claim_output(results_path)
+        if lock_file is None:
+            return None, active_job_id
+        lock_file.close()
+
+        job_id = job_queue.submit(_batch_job, batch_id)
+        with open(job_path, 'w', encoding='utf-8') as f:
+            f.write(job_id)
+    return job_id, None
+
+@app.route('/batches', methods=['POST'])
+def submit_batch():
+    """Queue a catalog of products uploaded as a CSV or JSONL file.
+
+    Returns the batch_id and the job_id to poll at /jobs/<job_id>; results are
+    written to /batches/<batch_id>/results as each product finishes.
+    """
+    upload = request.files.get('file')
+    if upload is None or upload.filename == '':
+        return jsonify({'error': 'Upload a CSV or JSONL file of products as file'}), 400
+
+    batch_id = uuid.uuid4().hex
+    batch_dir, products_path, _ = _batch_paths(batch_id)
+    os.makedirs(batch_dir, exist_ok=True)
+    upload_path = os.path.join(batch_dir, 'upload.jsonl' if upload.filename.endswith(('.jsonl', '.ndjson')) else 'upload.csv')
+    upload.save(upload_path)
+    try:
+        products = load_products(upload_path)
     except Exception as e:
-        return jsonify({'error': f'Analysis failed: {str(e)}'}), 500
+        return jsonify({'error': f'Could not read products: {str(e)}'}), 400
+    if not products:
+        return jsonify({'error': 'No products with text, image_url or image found'}), 400
+
+    # Keep the normalized products so a resume sees exactly the same ids
+    with open(products_path, 'w', encoding='utf-8') as f:
+        for product in products:
+            f.write(json.dumps(product) + '\n')
+
+    job_id, _ = _queue_batch(batch_id)
+    return jsonify({'batch_id': batch_id, 'job_id': job_id, 'products': len(products), 'status': 'queued'}), 202
+
+@app.route('/batches/<batch_id>/resume', methods=['POST'])
+def resume_batch(batch_id):
+    """Queue an interrupted or partly failed batch again; completed products are skipped.
+
+    Returns 409 with the active job_id while an earlier run is queued or running.
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', batch_id) or not os.path.exists(_batch_paths(batch_id)[1]):
+        return jsonify({'error': 'Batch not found'}), 404
+    job_id, active_job_id = _queue_batch(batch_id)
+    if job_id is None:
+        return jsonify({'error': 'Batch is already queued or running', 'job_id': active_job_id}), 409
+    return jsonify({'batch_id': batch_id, 'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/batches/<batch_id>/results', methods=['GET'])
+def get_batch_results(batch_id):
+    """Download a batch's results so far as JSON lines."""
+    if not re.fullmatch(r'[0-9a-f]{32}', batch_id):
+        return jsonify({'error': 'Batch not found'}), 404
+    results_path = _batch_paths(batch_id)[2]
+    if not os.path.exists(results_path):
+        return jsonify({'error': 'No results yet'}), 404
+    return send_file(os.path.abspath(results_path), mimetype='application/x-ndjson')
 
 @app.route('/persona/<segment_key>', methods=['GET'])
 def get_persona(segment_key):
@@ -121,11 +580,114 @@ def get_persona(segment_key):
         return jsonify(persona_data)
     return jsonify({'error': 'Persona not found'}), 404
 
+def _regenerate_segment(segment_key, video_only):
+    """Regenerate one stored segment and write it back to the store."""
+    record = cache_service.get_cached_persona(segment_key)
+    if not record:
+        return jsonify({'error': 'Persona not found'}), 404
+
+    existing = record['persona']
+    existing_persona = existing.get('persona') if isinstance(existing, dict) else existing
+    if video_only and (not existing_persona or str(existing_persona).startswith(FAILURE_PREFIXES)):
+        return jsonify({'error': 'Segment has no persona to base a video prompt on'}), 409
+
+    # Older records did not keep the full analysis; the segment's own details stand in for it
+    product_description = cache_service.get_product_description(record['query_hash']) or record['detailed_analysis']
+    persona, error = regenerate_segment(
+        record['segment_name'],
+        record['value_proposition'],
+        product_description,
+        # The prompts match the original run's, so a cached response would return the same text
+        _model_client(refresh=True),
+        persona=existing_persona if video_only else None,
+        tone=request.form.get('tone', '').strip() or None,
+        timeout=PERSONA_CALL_TIMEOUT,
+        video_grounding=VIDEO_PROMPT_GROUNDING,
+        product_context_tokens=PRODUCT_CONTEXT_TOKENS
+    )
+    if error:
+        return jsonify({'error': error}), 502
+
+    updated = cache_service.update_segment_persona(segment_key, persona)
+    if updated is None:
+        return jsonify({'error': 'Error storing regenerated persona'}), 500
+    return jsonify(updated)
+
+@app.route('/persona/<segment_key>/regenerate', methods=['POST'])
+def regenerate_persona(segment_key):
+    """Regenerate one segment's persona and video prompt; post tone to steer the video prompt."""
+    return _regenerate_segment(segment_key, video_only=False)
+
+@app.route('/persona/<segment_key>/video-prompt', methods=['POST'])
+def regenerate_video_prompt(segment_key):
+    """Regenerate only one segment's video prompt from its stored persona; post tone to change its tone."""
+    return _regenerate_segment(segment_key, video_only=True)
+
 @app.route('/personas', methods=['GET'])
 def get_all_personas():
-    """Retrieve all cached personas."""
-    personas = cache_service.get_all_personas()
-    return jsonify(personas)
+    """List cached personas one page at a time.
+
+    Query parameters: limit, cursor (next_cursor from the previous page),
+    query_hash, segment (name substring), since/until (ISO timestamps) and
+    fields (comma-separated columns, or 'summary' to leave out the analysis text).
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', PERSONAS_PAGE_SIZE)), 1), PERSONAS_MAX_PAGE_SIZE)
+        cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'limit and cursor must be integers'}), 400
+
+    fields = request.args.get('fields')
+    if fields == 'summary':
+        fields = [column for column in COLUMNS if column not in HEAVY_COLUMNS]
+    elif fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in fields if field != 'id' and field not in COLUMNS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    # The store is append-only, so the newest row id and the query identify the page
+    etag = None
+    last_row_id = cache_service.get_last_row_id()
+    if last_row_id is not None:
+        etag = hashlib.md5(f"{last_row_id}:{request.query_string.decode()}".encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+    personas, next_cursor = cache_service.list_personas(
+        fields=fields,
+        limit=limit,
+        cursor=cursor,
+        query_hash=request.args.get('query_hash'),
+        segment=request.args.get('segment'),
+        since=request.args.get('since'),
+        until=request.args.get('until')
+    )
+    response = jsonify({'personas': personas, 'next_cursor': next_cursor})
+    if etag:
+        response.set_etag(etag)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose pipeline, model call and cache metrics in Prometheus text format."""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def create_app(warm=False):
+    """Return the Flask app for a WSGI server (see wsgi.py and gunicorn.conf.py).
+
+    warm=True imports google-genai, Pillow and NumPy up front; with a
+    preloading server this happens once in the master so forked and respawned
+    workers start warm. The client itself is still created lazily, inside
+    each worker.
+    """
+    if warm:
+        import google.genai.types  # noqa: F401
+        import numpy  # noqa: F401
+        from PIL import Image, ImageOps  # noqa: F401
+    return app
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,62 @@
+"""Analyze a catalog of products from a CSV or JSONL file.
+
+    python batch_analyze.py products.csv -o results.jsonl --parallel 4
+
+Products have text (a description or website URL), image (a local path) or
+image_url columns, and optionally an id. Each output line holds one
+product's id, status and result or error. Running the same command again
+skips products that already completed, so an interrupted run resumes where it
+stopped and failed products are retried.
+"""
+import argparse
+import os
+import sys
+
+from services.batch_runner import claim_output, load_products, run_batch
+
+
+def format_progress(stats):
+    finished = stats['skipped'] + stats['completed'] + stats['failed']
+    eta = stats['eta_seconds']
+    eta_text = f"{eta / 60:.1f}m" if eta is not None else '-'
+    return (f"[{finished}/{stats['total']}] {stats['completed']} ok ({stats['cached']} from store), "
+            f"{stats['failed']} failed, {stats['skipped']} already done | "
+            f"{stats['per_minute']:.1f}/min, ETA {eta_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('products', help='CSV (with a header row) or JSONL file of products')
+    parser.add_argument('-o', '--output', help='JSONL results file (default: <products>.results.jsonl)')
+    parser.add_argument('--parallel', type=int, default=int(os.getenv('BATCH_PARALLELISM', '2')),
+                        help='Products analyzed at once')
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(args.products)[0]}.results.jsonl"
+    products = load_products(args.products)
+    if not products:
+        parser.error(f"no products with text, image or image_url found in {args.products}")
+
+    lock_file = claim_output(output)
+    if lock_file is None:
+        parser.error(f"another run is already writing {output}")
+
+    # Imported here so --help and argument errors stay fast
+    from app import analyze_product
+
+    stats = None
+    try:
+        for stats in run_batch(products, lambda product: analyze_product(product, allow_local_images=True),
+                               output, parallelism=args.parallel):
+            print(f"\r{format_progress(stats)}", end='', file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; run the same command again to resume. Results so far are in {output}",
+              file=sys.stderr)
+        sys.exit(130)
+
+    print(f"\nDone in {stats['elapsed_seconds']:.1f}s. Results are in {output}", file=sys.stderr)
+    sys.exit(1 if stats['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
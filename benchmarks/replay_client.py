@@ -0,0 +1,127 @@
+import ast
+import csv
+import json
+import random
+import re
+import sys
+import threading
+import time
+from google.genai.types import (
+    Candidate, Content, GenerateContentResponse, GenerateContentResponseUsageMetadata, Part
+)
+
+DEFAULT_RECORDINGS = 'cache/analysis_cache.csv'
+
+
+def _estimate_tokens(chars):
+    return -(-chars // 4)
+
+
+def load_recordings(csv_file=DEFAULT_RECORDINGS):
+    """Load recorded segments, personas and video prompts from an analysis cache CSV."""
+    csv.field_size_limit(sys.maxsize)
+    segments = []
+    with open(csv_file, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            persona = row.get('persona', '')
+            video_prompt = ''
+            if persona.startswith('{'):
+                try:
+                    parsed = ast.literal_eval(persona)
+                    persona = parsed.get('persona', '')
+                    video_prompt = parsed.get('video_prompt', '')
+                except (ValueError, SyntaxError):
+                    pass
+            segments.append({
+                'name': row['segment_name'],
+                'details': row.get('detailed_analysis', '').strip(),
+                'value_proposition': row.get('value_proposition', '').strip(),
+                'persona': persona,
+                'video_prompt': video_prompt
+            })
+    return segments
+
+
+class _ReplayModels:
+    def __init__(self, replay_client):
+        self._replay_client = replay_client
+
+    def generate_content(self, model, contents, config=None):
+        return self._replay_client.generate_content(model=model, contents=contents, config=config)
+
+
+class ReplayClient:
+    """Offline stand-in for genai.Client answering from recorded responses.
+
+    Each call sleeps for latency seconds plus Gaussian jitter (seeded, so runs
+    are reproducible) and returns a real GenerateContentResponse with usage
+    metadata estimated from the text sizes.
+    """
+
+    def __init__(self, recordings=None, latency=1.0, jitter=0.2, seed=0, error_rate=0.0):
+        self.recordings = recordings if recordings is not None else load_recordings()
+        if not self.recordings:
+            raise ValueError("ReplayClient needs at least one recorded segment")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.models = _ReplayModels(self)
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _segments_text(self):
+        return '\n\n'.join(
+            f"[{segment['name']}]\n{segment['details']}\n[{segment['value_proposition'] or segment['name']}]"
+            for segment in self.recordings
+        )
+
+    def _segment_for(self, prompt):
+        for segment in self.recordings:
+            if segment['name'] and segment['name'] in prompt:
+                return segment
+        return self.recordings[0]
+
+    def _respond(self, prompt):
+        if prompt.startswith('Analyze the provided product information'):
+            return '\n\n'.join(segment['details'] for segment in self.recordings)
+        if prompt.startswith('Extract and analyze the customer segments'):
+            return self._segments_text()
+        if prompt.startswith('Create a concise but detailed persona for EACH'):
+            include_video = 'video advertisement prompt' in prompt
+            names = re.findall(r'^- Segment: (.*)$', prompt, re.MULTILINE)
+            entries = []
+            for name in names:
+                segment = self._segment_for(name)
+                entry = {'segment_name': name, 'persona': segment['persona']}
+                if include_video:
+                    entry['video_prompt'] = segment['video_prompt']
+                entries.append(entry)
+            return json.dumps(entries)
+        if prompt.startswith('Create a concise but detailed persona'):
+            return self._segment_for(prompt)['persona']
+        if prompt.startswith('Create a concise 8-second video'):
+            return self._segment_for(prompt)['video_prompt']
+        return self.recordings[0]['details']
+
+    def generate_content(self, model, contents, config=None):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter))
+            fail = self._random.random() < self.error_rate
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED (simulated)")
+
+        prompt = next((part for part in contents if isinstance(part, str)), '')
+        text = self._respond(prompt)
+        prompt_tokens = _estimate_tokens(sum(len(part) for part in contents if isinstance(part, str)))
+        response_tokens = _estimate_tokens(len(text))
+        return GenerateContentResponse(
+            candidates=[Candidate(content=Content(role='model', parts=[Part(text=text)]))],
+            usage_metadata=GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=response_tokens,
+                total_token_count=prompt_tokens + response_tokens
+            )
+        )
@@ -0,0 +1,193 @@
+"""Offline latency/throughput benchmark for the analysis pipeline.
+
+Drives /analyze through the Flask test client (and, with --services, each
+service on its own) against ReplayClient, so no network or API key is needed:
+
+    python -m benchmarks.run_benchmark --users 4 --requests 5 --latency 0.5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.replay_client import ReplayClient, load_recordings
+
+# Each mode overrides app settings; 'inputs' controls how often submissions repeat
+MODES = {
+    'sequential': {'PERSONA_MAX_WORKERS': 1, 'PERSONA_BATCH_MODE': 'off', 'llm_cache': False, 'inputs': 'unique'},
+    'concurrent': {'PERSONA_MAX_WORKERS': 4, 'PERSONA_BATCH_MODE': 'off', 'llm_cache': False, 'inputs': 'unique'},
+    'batched': {'PERSONA_MAX_WORKERS': 4, 'PERSONA_BATCH_MODE': 'all', 'llm_cache': False, 'inputs': 'unique'},
+    'llm_cache': {'PERSONA_MAX_WORKERS': 4, 'PERSONA_BATCH_MODE': 'off', 'llm_cache': True, 'inputs': 'unique'},
+    'store_hit': {'PERSONA_MAX_WORKERS': 4, 'PERSONA_BATCH_MODE': 'off', 'llm_cache': False, 'inputs': 'repeat_no_refresh'}
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def load_app():
+    """Import the Flask app in a scratch directory so benchmark runs never touch the real store."""
+    os.environ.setdefault('GOOGLE_API_KEY', 'offline-benchmark')
+    os.environ['LLM_CACHE_BACKEND'] = 'none'
+    # The generated inputs are near-duplicates of each other; every request must run the pipeline
+    os.environ['SIMILARITY_THRESHOLD'] = '0'
+    os.chdir(tempfile.mkdtemp(prefix='analysis-bench-'))
+    import app as app_module
+    return app_module
+
+
+def configure_mode(app_module, mode, replay_client):
+    from services.llm_cache import CachedClient, MemoryBackend
+    from services.metrics import InstrumentedClient
+
+    settings = MODES[mode]
+    app_module.PERSONA_MAX_WORKERS = settings['PERSONA_MAX_WORKERS']
+    app_module.PERSONA_BATCH_MODE = settings['PERSONA_BATCH_MODE']
+    client = InstrumentedClient(replay_client)
+    if settings['llm_cache']:
+        client = CachedClient(client, backend=MemoryBackend())
+    app_module.client = client
+
+
+def request_form(mode, user, index):
+    inputs = MODES[mode]['inputs']
+    if inputs == 'unique':
+        return {'text_input': f"Benchmark product {mode} {user}-{index}: a portable solar power bank."}
+    return {'text_input': f"Benchmark product {mode} {index % 3}: a portable solar power bank."}
+
+
+def run_mode(app_module, mode, users, requests_per_user, replay_client):
+    configure_mode(app_module, mode, replay_client)
+    calls_before = replay_client.calls
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def user_loop(user):
+        test_client = app_module.app.test_client()
+        for index in range(requests_per_user):
+            started = time.perf_counter()
+            response = test_client.post('/analyze', data=request_form(mode, user, index))
+            elapsed = time.perf_counter() - started
+            body = response.get_json(silent=True) or {}
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200 or body.get('error'):
+                    errors.append(body.get('error') or f"HTTP {response.status_code}")
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user_loop, args=(user,)) for user in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    model_calls = replay_client.calls - calls_before
+
+    # Memory per request is sampled on one extra request with tracing on
+    tracemalloc.start()
+    app_module.app.test_client().post('/analyze', data=request_form(mode, 'mem', 0))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = len(latencies)
+    return {
+        'mode': mode,
+        'requests': total,
+        'errors': len(errors),
+        'model_calls': model_calls,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'mean': statistics.mean(latencies) if latencies else 0.0,
+        'throughput': total / wall if wall else 0.0,
+        'peak_mem_kb': peak / 1024
+    }
+
+
+def run_services(replay_client, repeats):
+    """Time each service on its own against the replay client."""
+    from services.detailed_analysis import get_detailed_analysis
+    from services.revenue_analysis import get_revenue_segments
+    from services.persona_generator import generate_personas
+
+    timings = {'detailed_analysis': [], 'revenue_segments': [], 'personas_sequential': [], 'personas_concurrent': []}
+    for index in range(repeats):
+        started = time.perf_counter()
+        detailed_analysis, _ = get_detailed_analysis(text_input=f"Service benchmark {index}", client=replay_client)
+        timings['detailed_analysis'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        segments_result, _ = get_revenue_segments(detailed_analysis, replay_client)
+        timings['revenue_segments'].append(time.perf_counter() - started)
+
+        for name, workers in (('personas_sequential', 1), ('personas_concurrent', 4)):
+            started = time.perf_counter()
+            generate_personas(
+                segments_result['parsed_segments'], {'description': detailed_analysis}, replay_client,
+                max_workers=workers
+            )
+            timings[name].append(time.perf_counter() - started)
+
+    return {name: {'p50': percentile(values, 50), 'mean': statistics.mean(values)} for name, values in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated modes to run')
+    parser.add_argument('--users', type=int, default=4, help='Concurrent simulated users')
+    parser.add_argument('--requests', type=int, default=5, help='Requests per user')
+    parser.add_argument('--latency', type=float, default=0.5, help='Mean model call latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.1, help='Standard deviation of call latency')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--recordings', default=os.path.join(REPO_ROOT, 'cache', 'analysis_cache.csv'),
+                        help='Analysis cache CSV to replay responses from')
+    parser.add_argument('--services', action='store_true', help='Also time each service on its own')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    recordings = load_recordings(args.recordings)
+    replay_client = ReplayClient(recordings, latency=args.latency, jitter=args.jitter, seed=args.seed)
+    app_module = load_app()
+
+    results = []
+    print(f"{'mode':<12} {'reqs':>5} {'err':>4} {'calls':>6} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+          f"{'req/s':>7} {'peak KB':>9}")
+    for mode in [mode.strip() for mode in args.modes.split(',') if mode.strip()]:
+        if mode not in MODES:
+            parser.error(f"unknown mode {mode!r}; choose from {', '.join(MODES)}")
+        result = run_mode(app_module, mode, args.users, args.requests, replay_client)
+        results.append(result)
+        print(f"{mode:<12} {result['requests']:>5} {result['errors']:>4} {result['model_calls']:>6} "
+              f"{result['p50']:>7.3f} {result['p95']:>7.3f} {result['p99']:>7.3f} "
+              f"{result['throughput']:>7.2f} {result['peak_mem_kb']:>9.0f}")
+
+    output = {'settings': vars(args), 'modes': results}
+    if args.services:
+        output['services'] = run_services(replay_client, args.requests)
+        for name, timing in output['services'].items():
+            print(f"{name:<22} p50 {timing['p50']:.3f}s  mean {timing['mean']:.3f}s")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Multi-process production profile: gunicorn -c gunicorn.conf.py wsgi:app"""
+import multiprocessing
+import os
+
+# Workers share the analysis store (SQLite in WAL mode); model responses are
+# shared through the on-disk cache instead of a per-process memory cache
+os.environ.setdefault('LLM_CACHE_BACKEND', 'disk')
+# /metrics adds up every worker's values instead of reporting the one that answers
+os.environ.setdefault('METRICS_DIR', 'cache/metrics')
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+# Each worker builds its own API governor; the app splits the GEMINI_* limits between them
+os.environ['SERVER_WORKERS'] = str(workers)
+# Threads keep a worker responsive while its requests wait on the model API or stream results
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '8'))
+# A full analysis makes several sequential model calls
+timeout = int(os.getenv('WEB_TIMEOUT', '300'))
+graceful_timeout = 30
+keepalive = 5
+
+# Import the app, run store migrations and load heavy modules once in the
+# master; workers fork from it and open their own database connections and
+# API clients on first use
+preload_app = True
+
+
+def on_starting(server):
+    # Counters start from zero with the server, as they would in a single process
+    from services.metrics import clear_multiprocess
+    clear_multiprocess(os.environ['METRICS_DIR'])
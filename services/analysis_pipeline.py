@@ -0,0 +1,112 @@
+import hashlib
+import time
+from services.detailed_analysis import get_detailed_analysis
+from services.revenue_analysis import get_revenue_segments
+from services.persona_generator import iter_personas, persona_failed
+from services import metrics
+
+
+def _persona_checkpoint_key(segment, video_grounding):
+    raw = f"{segment['name']}\n{segment['value_proposition']}\n{video_grounding}"
+    return hashlib.md5(raw.encode()).hexdigest()[:8]
+
+
+def run_pipeline(image_data=None, text_input=None, client=None, max_workers=1, timeout=None,
+                 batch_mode='off', video_grounding=True, image_mime_type=None,
+                 checkpoints=None, fingerprint=None, product_context_tokens=None):
+    """Run the analysis stages, yielding (stage, data) as each one completes.
+
+    Stages are 'detailed_analysis', 'segments', one 'persona' per segment as
+    soon as it is ready, and finally 'personas' with every persona in segment
+    order. A failure yields ('error', message) and ends the run. Persona
+    options are passed through to iter_personas; image_mime_type marks
+    image_data as already preprocessed.
+
+    With a checkpoint store (CacheService) and the request fingerprint, each
+    completed stage and each successful persona is saved as it finishes, and a
+    rerun of the same fingerprint resumes from the first unfinished step.
+    """
+    use_checkpoints = checkpoints is not None and fingerprint is not None
+
+    # Step 1: Get detailed analysis
+    detailed_analysis = None
+    if use_checkpoints:
+        detailed_analysis = checkpoints.load_checkpoint(fingerprint, 'detailed_analysis')
+    if detailed_analysis is None:
+        started = time.perf_counter()
+        detailed_analysis, error = get_detailed_analysis(
+            image_data=image_data,
+            text_input=text_input,
+            client=client,
+            image_mime_type=image_mime_type
+        )
+        metrics.observe_stage('detailed_analysis', time.perf_counter() - started, error)
+        if error:
+            yield 'error', error
+            return
+        if use_checkpoints:
+            checkpoints.save_checkpoint(fingerprint, 'detailed_analysis', detailed_analysis)
+    yield 'detailed_analysis', detailed_analysis
+
+    # Step 2: Get revenue segments
+    segments_result = None
+    if use_checkpoints:
+        segments_result = checkpoints.load_checkpoint(fingerprint, 'segments')
+    if segments_result is None:
+        started = time.perf_counter()
+        segments_result, error = get_revenue_segments(detailed_analysis, client)
+        metrics.observe_stage('revenue_segments', time.perf_counter() - started, error)
+        if error:
+            yield 'error', error
+            return
+        # A reply with no parseable segments is retried from scratch rather than resumed
+        if use_checkpoints and segments_result['parsed_segments']:
+            checkpoints.save_checkpoint(fingerprint, 'segments', segments_result)
+    yield 'segments', segments_result
+
+    # Step 3: Generate personas for each segment
+    # Time spent by the consumer between yields is excluded from the stage
+    checkpoint_keys = {
+        segment['name']: _persona_checkpoint_key(segment, video_grounding)
+        for segment in segments_result['parsed_segments']
+    }
+    resumed = {}
+    if use_checkpoints:
+        for segment_name, item_key in checkpoint_keys.items():
+            persona = checkpoints.load_checkpoint(fingerprint, 'persona', item_key)
+            if persona is not None:
+                resumed[segment_name] = persona
+
+    completed = {}
+    persona_seconds = 0.0
+    started = time.perf_counter()
+    try:
+        for segment_name, persona in iter_personas(
+            segments=segments_result['parsed_segments'],
+            product_details={'description': detailed_analysis},
+            client=client,
+            max_workers=max_workers,
+            timeout=timeout,
+            batch_mode=batch_mode,
+            video_grounding=video_grounding,
+            completed=resumed,
+            product_context_tokens=product_context_tokens
+        ):
+            persona_seconds += time.perf_counter() - started
+            completed[segment_name] = persona
+            # Failed personas are not saved so a retry regenerates them
+            if use_checkpoints and segment_name not in resumed and not persona_failed(persona):
+                checkpoints.save_checkpoint(fingerprint, 'persona', persona, checkpoint_keys[segment_name])
+            yield 'persona', {'segment_name': segment_name, 'persona': persona}
+            started = time.perf_counter()
+    except Exception as e:
+        error = f"Error generating personas: {str(e)}"
+        metrics.observe_stage('personas', persona_seconds + time.perf_counter() - started, error)
+        yield 'error', error
+        return
+    metrics.observe_stage('personas', persona_seconds + time.perf_counter() - started)
+
+    personas = {}
+    for segment in segments_result['parsed_segments']:
+        personas[segment['name']] = completed[segment['name']]
+    yield 'personas', personas
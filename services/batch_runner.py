@@ -0,0 +1,172 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import fcntl
+except ImportError:  # Windows: runs are not guarded against each other
+    fcntl = None
+
+PRODUCT_FIELDS = ('id', 'text', 'text_type', 'image', 'image_url')
+
+
+def product_id(product):
+    """Stable id for a product without one, derived from its inputs."""
+    raw = json.dumps({field: product.get(field) for field in PRODUCT_FIELDS if field != 'id'}, sort_keys=True)
+    return hashlib.md5(raw.encode()).hexdigest()[:12]
+
+
+def load_products(path):
+    """Read products from a CSV file with a header row or from a JSONL file.
+
+    Each product may have text (a description, or a website URL), image (a
+    local file path, relative to the products file) and image_url. text_type
+    defaults to 'url' for text that is a bare http(s) URL. Products without an
+    id get one derived from their inputs, so reruns recognize them.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith(('.jsonl', '.ndjson')):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = list(csv.DictReader(f))
+
+    products = []
+    for record in records:
+        product = {}
+        for field in PRODUCT_FIELDS:
+            value = record.get(field)
+            product[field] = str(value).strip() if value not in (None, '') else None
+        if not product['text'] and not product['image'] and not product['image_url']:
+            continue
+        if product['image'] and not os.path.isabs(product['image']):
+            product['image'] = os.path.join(os.path.dirname(os.path.abspath(path)), product['image'])
+        if not product['text_type']:
+            text = product['text'] or ''
+            is_url = text.startswith(('http://', 'https://')) and not any(char.isspace() for char in text)
+            product['text_type'] = 'url' if is_url else 'text'
+        if not product['id']:
+            product['id'] = product_id(product)
+        products.append(product)
+    return products
+
+
+def completed_ids(output_path):
+    """Ids of products recorded as completed in an output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interruption
+                continue
+            if record.get('status') == 'completed':
+                done.add(record.get('id'))
+    return done
+
+
+def claim_output(output_path):
+    """Take an exclusive lock on output_path for one run, or return None if another run holds it.
+
+    Two runs on the same output would analyze the same pending products and
+    append duplicate lines. The lock is held until the returned file is
+    closed, and the OS releases it if the process dies, so an interrupted
+    run never blocks its resume.
+    """
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    lock_file = open(f"{output_path}.lock", 'w')
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+    return lock_file
+
+
+def _timed(analyze_product, product):
+    started = time.perf_counter()
+    result, error = analyze_product(product)
+    return result, error, time.perf_counter() - started
+
+
+def run_batch(products, analyze_product, output_path, parallelism=2):
+    """Analyze products in parallel, appending one JSON line per product to output_path.
+
+    analyze_product(product) returns (result, error). Products already
+    completed in output_path are skipped, so an interrupted run resumes where
+    it stopped; failed products are tried again. Yields a stats dict (counts,
+    elapsed seconds, products per minute and an ETA) after each product.
+    """
+    done = completed_ids(output_path)
+    pending = [product for product in products if product['id'] not in done]
+    stats = {
+        'total': len(products),
+        'skipped': len(products) - len(pending),
+        'completed': 0,
+        'failed': 0,
+        'cached': 0,
+        'elapsed_seconds': 0.0,
+        'per_minute': 0.0,
+        'eta_seconds': None
+    }
+    if not pending:
+        yield dict(stats)
+        return
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # Start on a fresh line if the previous run died mid-write
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+
+    started = time.perf_counter()
+    with open(output_path, 'a', encoding='utf-8') as out:
+        executor = ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix='batch')
+        try:
+            futures = {executor.submit(_timed, analyze_product, product): product for product in pending}
+            for future in as_completed(futures):
+                product = futures[future]
+                try:
+                    result, error, seconds = future.result()
+                except Exception as e:
+                    result, error, seconds = None, f"Analysis failed: {str(e)}", 0.0
+
+                record = {
+                    'id': product['id'],
+                    'status': 'failed' if error else 'completed',
+                    'seconds': round(seconds, 3),
+                    'input': {field: product[field] for field in PRODUCT_FIELDS if field != 'id' and product[field]}
+                }
+                if error:
+                    record['error'] = error
+                    stats['failed'] += 1
+                else:
+                    record['result'] = result
+                    stats['completed'] += 1
+                    if result.get('cached'):
+                        stats['cached'] += 1
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+
+                finished = stats['completed'] + stats['failed']
+                elapsed = time.perf_counter() - started
+                stats['elapsed_seconds'] = round(elapsed, 3)
+                stats['per_minute'] = round(finished / elapsed * 60, 2) if elapsed else 0.0
+                stats['eta_seconds'] = round((len(pending) - finished) * elapsed / finished, 1)
+                yield dict(stats)
+        finally:
+            # Products still running are not recorded and will be redone on resume
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -1,33 +1,299 @@
-import pandas as pd
+import ast
+import csv
 import os
 import hashlib
 import json
+import sqlite3
+import sys
+import threading
+import zlib
 from datetime import datetime
+from services.segment_parser import parse_segments
+
+COLUMNS = [
+    'timestamp',
+    'query_hash',
+    'segment_name',
+    'segment_key',
+    'detailed_analysis',
+    'revenue_analysis',
+    'persona',
+    'value_proposition'
+]
+
+# Large text columns that list views usually leave out
+HEAVY_COLUMNS = ('detailed_analysis', 'revenue_analysis')
+
+# Heavy values at least this long are stored once in the blobs table and referenced by hash
+BLOB_MIN_SIZE = 256
+BLOB_REF_PREFIX = 'blob:sha256:'
+
 
 class CacheService:
-    def __init__(self, cache_file='cache/analysis_cache.csv'):
-        self.cache_dir = os.path.dirname(cache_file)
-        self.cache_file = cache_file
+    """Append-only analysis store backed by SQLite in WAL mode.
+
+    Every cached segment is kept as a new row, so history survives repeated
+    analyses; point lookups go through indexes on segment_key and query_hash.
+    Large text (the analysis columns and full results) lives in a
+    content-addressed, zlib-compressed blobs table, so the grounding HTML
+    shared by every segment of a query is stored once and only decompressed
+    when a read asks for that column.
+    """
+
+    def __init__(self, db_file='cache/analysis_cache.db', csv_file='cache/analysis_cache.csv',
+                 checkpoint_ttl=7 * 24 * 3600):
+        self.cache_dir = os.path.dirname(db_file)
+        self.db_file = db_file
+        self.csv_file = csv_file
+        self.checkpoint_ttl = checkpoint_ttl
+        self._local = threading.local()
         self._ensure_cache_exists()
 
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        # A connection inherited from a pre-fork server master must not be shared
+        if conn is not None and self._local.pid != os.getpid():
+            conn = None
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
     def _ensure_cache_exists(self):
-        """Ensure cache directory and file exist."""
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir)
-        
-        if not os.path.exists(self.cache_file):
-            # Create empty DataFrame with required columns
-            df = pd.DataFrame(columns=[
-                'timestamp',
-                'query_hash',
-                'segment_name',
-                'segment_key',
-                'detailed_analysis',
-                'revenue_analysis',
-                'persona',
-                'value_proposition'
-            ])
-            df.to_csv(self.cache_file, index=False)
+        """Ensure cache directory and tables exist, migrating the legacy CSV once."""
+        if self.cache_dir and not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                query_hash TEXT NOT NULL,
+                segment_name TEXT NOT NULL,
+                segment_key TEXT NOT NULL,
+                detailed_analysis TEXT,
+                revenue_analysis TEXT,
+                persona TEXT,
+                value_proposition TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_analysis_segment_key ON analysis_cache (segment_key, id);
+            CREATE INDEX IF NOT EXISTS idx_analysis_query_hash ON analysis_cache (query_hash, id);
+            CREATE INDEX IF NOT EXISTS idx_analysis_timestamp ON analysis_cache (timestamp);
+            CREATE TABLE IF NOT EXISTS analysis_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                query_hash TEXT NOT NULL,
+                result TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_results_query_hash ON analysis_results (query_hash, id);
+            CREATE TABLE IF NOT EXISTS stage_checkpoints (
+                fingerprint TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                item_key TEXT NOT NULL DEFAULT '',
+                timestamp TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (fingerprint, stage, item_key)
+            );
+            CREATE TABLE IF NOT EXISTS similarity_index (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query_hash TEXT NOT NULL UNIQUE,
+                timestamp TEXT NOT NULL,
+                text_signature BLOB,
+                image_phash TEXT
+            );
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                finished_at REAL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                compressed INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cache_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._migrate_csv()
+        self._compact_blobs()
+        self._prune_checkpoints()
+
+    def _migrate_csv(self):
+        """Import rows from the legacy CSV cache the first time the database is opened."""
+        if not self.csv_file or not os.path.exists(self.csv_file):
+            return
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            done = conn.execute(
+                "SELECT value FROM cache_meta WHERE key = 'csv_migrated'"
+            ).fetchone()
+            if done:
+                conn.execute('COMMIT')
+                return
+
+            # Persona blobs and grounding HTML easily exceed the default field limit
+            csv.field_size_limit(sys.maxsize)
+            with open(self.csv_file, newline='', encoding='utf-8') as f:
+                rows = [
+                    self._row_values(self._pack_entry(conn, {
+                        **row,
+                        'persona': self._parse_legacy_persona(row.get('persona', ''))
+                    }))
+                    for row in csv.DictReader(f)
+                ]
+
+            conn.executemany(self._insert_sql(), rows)
+            conn.execute(
+                "INSERT INTO cache_meta (key, value) VALUES ('csv_migrated', ?)",
+                (datetime.now().isoformat(),)
+            )
+            conn.execute('COMMIT')
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            print(f"Error migrating CSV cache: {str(e)}")
+
+    def _compact_blobs(self):
+        """Move heavy values written by older versions inline into the blobs table, once."""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            done = conn.execute(
+                "SELECT value FROM cache_meta WHERE key = 'blobs_compacted'"
+            ).fetchone()
+            if done:
+                conn.execute('COMMIT')
+                return
+
+            for column in HEAVY_COLUMNS:
+                rows = conn.execute(
+                    f"SELECT id, {column} FROM analysis_cache "
+                    f"WHERE length({column}) >= ? AND {column} NOT LIKE ?",
+                    (BLOB_MIN_SIZE, f"{BLOB_REF_PREFIX}%")
+                ).fetchall()
+                conn.executemany(
+                    f"UPDATE analysis_cache SET {column} = ? WHERE id = ?",
+                    [(self._store_blob(conn, row[column]), row['id']) for row in rows]
+                )
+            rows = conn.execute(
+                "SELECT id, result FROM analysis_results WHERE result NOT LIKE ?",
+                (f"{BLOB_REF_PREFIX}%",)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE analysis_results SET result = ? WHERE id = ?",
+                [(self._store_blob(conn, row['result']), row['id']) for row in rows]
+            )
+
+            conn.execute(
+                "INSERT INTO cache_meta (key, value) VALUES ('blobs_compacted', ?)",
+                (datetime.now().isoformat(),)
+            )
+            conn.execute('COMMIT')
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            print(f"Error compacting analysis cache: {str(e)}")
+
+    @staticmethod
+    def _store_blob(conn, text):
+        """Store text once under its hash and return the reference kept in its place."""
+        raw = text.encode('utf-8')
+        digest = hashlib.sha256(raw).hexdigest()
+        packed = zlib.compress(raw, 6)
+        compressed = len(packed) < len(raw)
+        conn.execute(
+            "INSERT OR IGNORE INTO blobs (hash, compressed, data) VALUES (?, ?, ?)",
+            (digest, int(compressed), packed if compressed else raw)
+        )
+        return f"{BLOB_REF_PREFIX}{digest}"
+
+    def _load_blobs(self, refs):
+        """Resolve blob references to their text in one query."""
+        hashes = list({ref[len(BLOB_REF_PREFIX):] for ref in refs})
+        texts = {}
+        # Stay under SQLite's bound parameter limit
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            rows = self._connect().execute(
+                f"SELECT hash, compressed, data FROM blobs WHERE hash IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            ).fetchall()
+            for row in rows:
+                data = zlib.decompress(row['data']) if row['compressed'] else row['data']
+                texts[f"{BLOB_REF_PREFIX}{row['hash']}"] = data.decode('utf-8')
+        return texts
+
+    def _pack_entry(self, conn, entry):
+        """Swap large heavy values in an entry for blob references."""
+        packed = dict(entry)
+        for column in HEAVY_COLUMNS:
+            value = packed.get(column)
+            if isinstance(value, str) and len(value) >= BLOB_MIN_SIZE:
+                packed[column] = self._store_blob(conn, value)
+        return packed
+
+    def _unpack_records(self, records):
+        """Replace blob references in the returned records with their text."""
+        refs = [
+            value for record in records for value in record.values()
+            if isinstance(value, str) and value.startswith(BLOB_REF_PREFIX)
+        ]
+        if not refs:
+            return records
+        texts = self._load_blobs(refs)
+        for record in records:
+            for column, value in record.items():
+                if isinstance(value, str) and value.startswith(BLOB_REF_PREFIX):
+                    record[column] = texts.get(value, '')
+        return records
+
+    @staticmethod
+    def _parse_legacy_persona(value):
+        """The CSV stored persona dicts via str(); turn them back into dicts."""
+        if value and value.startswith('{'):
+            try:
+                return ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                pass
+        return value
+
+    @staticmethod
+    def _insert_sql():
+        return (
+            f"INSERT INTO analysis_cache ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in COLUMNS)})"
+        )
+
+    @staticmethod
+    def _row_values(entry):
+        values = []
+        for column in COLUMNS:
+            value = entry.get(column)
+            if column == 'persona' and not isinstance(value, str):
+                value = json.dumps(value)
+            values.append(value if value is not None else '')
+        return values
+
+    @staticmethod
+    def _row_to_dict(row, columns=COLUMNS):
+        record = {column: row[column] for column in columns}
+        persona = record.get('persona')
+        if persona and persona.startswith('{'):
+            try:
+                record['persona'] = json.loads(persona)
+            except ValueError:
+                pass
+        return record
 
     def _generate_segment_key(self, segment_name, value_proposition):
         """Generate a unique but consistent key for a segment."""
@@ -38,70 +304,267 @@ class CacheService:
         # Take first 8 characters of hash for a shorter but still unique key
         return hash_obj.hexdigest()[:8]
 
+    def generate_query_hash(self, query_input):
+        """Generate a consistent key for a normalized query input.
+
+        The key serves stored results and checkpoints to anyone submitting the
+        same input, so it uses the full digest to rule out collisions.
+        """
+        return hashlib.sha256(str(query_input).encode()).hexdigest()
+
     def cache_analysis(self, query_input, segments_data, personas):
         """Cache the analysis results."""
         # Generate query hash
-        query_hash = hashlib.md5(str(query_input).encode()).hexdigest()[:8]
-        
+        query_hash = self.generate_query_hash(query_input)
+
         # Create new cache entries
         cache_entries = []
-        
-        # Split segments and process each one
-        segments = segments_data['segments'].split('[')[1::2]  # Skip empty strings and value props
-        
+
+        segments = segments_data.get('parsed_segments')
+        if segments is None:
+            segments = parse_segments(segments_data['segments'])
+
         for segment in segments:
+            segment_name = segment['name']
+            value_proposition = segment['value_proposition']
+
+            # Create cache entry
+            cache_entries.append({
+                'timestamp': datetime.now().isoformat(),
+                'query_hash': query_hash,
+                'segment_name': segment_name,
+                'segment_key': self._generate_segment_key(segment_name, value_proposition),
+                'detailed_analysis': segment['details'],
+                'revenue_analysis': segments_data.get('grounding_data', ''),
+                'persona': personas.get(segment_name, ''),
+                'value_proposition': value_proposition
+            })
+
+        # Append new rows; earlier analyses stay in the history
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
             try:
-                # Extract segment information
-                segment_name = segment.split(']')[0].strip()
-                
-                # Get value proposition (text between last set of square brackets)
-                value_prop_start = segment.rfind('[')
-                value_prop_end = segment.rfind(']')
-                value_proposition = ""
-                if value_prop_start != -1 and value_prop_end != -1:
-                    value_proposition = segment[value_prop_start+1:value_prop_end].strip()
-                
-                # Get main content (between segment name and value proposition)
-                main_content = segment.split(']')[1]
-                if value_prop_start != -1:
-                    main_content = main_content[:value_prop_start].strip()
-                
-                # Generate segment key
-                segment_key = self._generate_segment_key(segment_name, value_proposition)
-                
-                # Create cache entry
-                cache_entry = {
-                    'timestamp': datetime.now().isoformat(),
-                    'query_hash': query_hash,
-                    'segment_name': segment_name,
-                    'segment_key': segment_key,
-                    'detailed_analysis': main_content,
-                    'revenue_analysis': segments_data.get('grounding_data', ''),
-                    'persona': personas.get(segment_name, ''),
-                    'value_proposition': value_proposition
-                }
-                
-                cache_entries.append(cache_entry)
-                
-            except Exception as e:
-                print(f"Error processing segment {segment_name}: {str(e)}")
-                continue
-        
-        # Create DataFrame from new entries
-        new_df = pd.DataFrame(cache_entries)
-        
-        # Save to CSV (overwrite existing)
-        new_df.to_csv(self.cache_file, index=False)
-        
+                conn.executemany(
+                    self._insert_sql(),
+                    [self._row_values(self._pack_entry(conn, entry)) for entry in cache_entries]
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            print(f"Error writing analysis cache: {str(e)}")
+
         return {segment['segment_key']: segment for segment in cache_entries}
 
+    def cache_result(self, query_hash, result):
+        """Store the full response for a query so repeat requests can skip the pipeline."""
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    "INSERT INTO analysis_results (timestamp, query_hash, result) VALUES (?, ?, ?)",
+                    (datetime.now().isoformat(), query_hash, self._store_blob(conn, json.dumps(result)))
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            print(f"Error writing analysis result: {str(e)}")
+
+    def get_cached_result(self, query_hash):
+        """Retrieve the most recent full response for a query hash."""
+        try:
+            row = self._connect().execute(
+                "SELECT result FROM analysis_results WHERE query_hash = ? ORDER BY id DESC LIMIT 1",
+                (query_hash,)
+            ).fetchone()
+            if row:
+                return self._load_result(row['result'])
+            return None
+        except Exception as e:
+            print(f"Error retrieving analysis result: {str(e)}")
+            return None
+
+    def _load_result(self, stored):
+        if stored.startswith(BLOB_REF_PREFIX):
+            stored = self._load_blobs([stored])[stored]
+        return json.loads(stored)
+
+    def update_segment_persona(self, segment_key, persona):
+        """Store a regenerated persona for one segment.
+
+        Appends a new row for the segment, leaving every other segment alone,
+        and a new version of its query's stored result with just this
+        segment's persona replaced. Returns the updated record, or None if the
+        segment key is unknown.
+        """
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    "SELECT * FROM analysis_cache WHERE segment_key = ? ORDER BY id DESC LIMIT 1",
+                    (segment_key,)
+                ).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+
+                timestamp = datetime.now().isoformat()
+                entry = {**self._row_to_dict(row), 'timestamp': timestamp, 'persona': persona}
+                conn.execute(self._insert_sql(), self._row_values(entry))
+
+                result_row = conn.execute(
+                    "SELECT result FROM analysis_results WHERE query_hash = ? ORDER BY id DESC LIMIT 1",
+                    (entry['query_hash'],)
+                ).fetchone()
+                if result_row:
+                    result = self._load_result(result_row['result'])
+                    if entry['segment_name'] in result.get('personas', {}):
+                        result['personas'][entry['segment_name']] = persona
+                        conn.execute(
+                            "INSERT INTO analysis_results (timestamp, query_hash, result) VALUES (?, ?, ?)",
+                            (timestamp, entry['query_hash'], self._store_blob(conn, json.dumps(result)))
+                        )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            print(f"Error updating segment persona: {str(e)}")
+            return None
+
+        return self._unpack_records([entry])[0]
+
+    def get_product_description(self, query_hash):
+        """Return the detailed analysis a query's personas were generated from, if it was stored."""
+        result = self.get_cached_result(query_hash)
+        return result.get('detailed_analysis') if result else None
+
+    def save_checkpoint(self, fingerprint, stage, data, item_key=''):
+        """Persist one completed pipeline stage (or one item of it) for later resumption."""
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO stage_checkpoints (fingerprint, stage, item_key, timestamp, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (fingerprint, stage, item_key, datetime.now().isoformat(), json.dumps(data))
+            )
+        except Exception as e:
+            print(f"Error saving checkpoint: {str(e)}")
+
+    def load_checkpoint(self, fingerprint, stage, item_key=''):
+        """Return a stage's checkpointed output, or None if it has not completed."""
+        try:
+            row = self._connect().execute(
+                "SELECT data FROM stage_checkpoints WHERE fingerprint = ? AND stage = ? AND item_key = ?",
+                (fingerprint, stage, item_key)
+            ).fetchone()
+            if row:
+                return json.loads(row['data'])
+            return None
+        except Exception as e:
+            print(f"Error loading checkpoint: {str(e)}")
+            return None
+
+    def clear_checkpoints(self, fingerprint):
+        """Drop every checkpoint for a fingerprint so the next run starts from scratch."""
+        try:
+            self._connect().execute("DELETE FROM stage_checkpoints WHERE fingerprint = ?", (fingerprint,))
+        except Exception as e:
+            print(f"Error clearing checkpoints: {str(e)}")
+
+    def _prune_checkpoints(self):
+        """Remove checkpoints older than checkpoint_ttl."""
+        if not self.checkpoint_ttl:
+            return
+        cutoff = datetime.fromtimestamp(datetime.now().timestamp() - self.checkpoint_ttl).isoformat()
+        try:
+            self._connect().execute("DELETE FROM stage_checkpoints WHERE timestamp < ?", (cutoff,))
+        except Exception as e:
+            print(f"Error pruning checkpoints: {str(e)}")
+
+    def add_similarity_entry(self, query_hash, text_signature=None, image_phash=None):
+        """Record the near-duplicate fingerprints of an analyzed input."""
+        try:
+            self._connect().execute(
+                "INSERT OR IGNORE INTO similarity_index (query_hash, timestamp, text_signature, image_phash) "
+                "VALUES (?, ?, ?, ?)",
+                (query_hash, datetime.now().isoformat(), text_signature, image_phash)
+            )
+        except Exception as e:
+            print(f"Error writing similarity entry: {str(e)}")
+
+    def get_similarity_entries(self, after_id=0):
+        """Return similarity entries added after the given id, oldest first."""
+        try:
+            return self._connect().execute(
+                "SELECT id, query_hash, text_signature, image_phash FROM similarity_index "
+                "WHERE id > ? ORDER BY id",
+                (after_id,)
+            ).fetchall()
+        except Exception as e:
+            print(f"Error reading similarity entries: {str(e)}")
+            return []
+
+    def save_job(self, job):
+        """Publish a job's public status so any server process can read it."""
+        try:
+            self._connect().execute(
+                "INSERT INTO jobs (job_id, finished_at, data) VALUES (?, ?, ?) "
+                "ON CONFLICT (job_id) DO UPDATE SET finished_at = excluded.finished_at, data = excluded.data",
+                (job['job_id'], job['finished_at'], json.dumps(job))
+            )
+        except Exception as e:
+            print(f"Error saving job: {str(e)}")
+
+    def load_job(self, job_id):
+        """Return a job's last published status, or None if unknown."""
+        try:
+            row = self._connect().execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row:
+                return json.loads(row['data'])
+            return None
+        except Exception as e:
+            print(f"Error loading job: {str(e)}")
+            return None
+
+    def request_job_cancel(self, job_id):
+        """Flag a job for cancellation by the process running it."""
+        try:
+            self._connect().execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+        except Exception as e:
+            print(f"Error requesting job cancellation: {str(e)}")
+
+    def job_cancel_requested(self, job_id):
+        try:
+            row = self._connect().execute(
+                "SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            return bool(row and row['cancel_requested'])
+        except Exception as e:
+            print(f"Error reading job cancellation: {str(e)}")
+            return False
+
+    def prune_jobs(self, cutoff):
+        """Drop jobs that finished before cutoff (a time.time() value)."""
+        try:
+            self._connect().execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+        except Exception as e:
+            print(f"Error pruning jobs: {str(e)}")
+
     def get_cached_persona(self, segment_key):
-        """Retrieve a cached persona by segment key."""
+        """Retrieve the most recent cached persona by segment key."""
         try:
-            df = pd.read_csv(self.cache_file)
-            persona_row = df[df['segment_key'] == segment_key]
-            if not persona_row.empty:
-                return persona_row.iloc[0].to_dict()
+            row = self._connect().execute(
+                "SELECT * FROM analysis_cache WHERE segment_key = ? ORDER BY id DESC LIMIT 1",
+                (segment_key,)
+            ).fetchone()
+            if row:
+                return self._unpack_records([self._row_to_dict(row)])[0]
             return None
         except Exception as e:
             print(f"Error retrieving cached persona: {str(e)}")
@@ -110,8 +573,66 @@ class CacheService:
     def get_all_personas(self):
         """Retrieve all cached personas."""
         try:
-            df = pd.read_csv(self.cache_file)
-            return df.to_dict('records')
+            rows = self._connect().execute(
+                "SELECT * FROM analysis_cache ORDER BY id"
+            ).fetchall()
+            return self._unpack_records([self._row_to_dict(row) for row in rows])
         except Exception as e:
             print(f"Error retrieving all personas: {str(e)}")
             return []
+
+    def list_personas(self, fields=None, limit=50, cursor=None, query_hash=None, segment=None,
+                      since=None, until=None):
+        """Return one page of cached personas and the cursor for the next page.
+
+        Rows come back oldest first; cursor is the id of the last row already
+        seen, so paging is a keyset scan that stays cheap as history grows.
+        fields limits the returned columns ('id' plus any of COLUMNS); segment
+        matches a substring of the segment name and since/until bound the ISO
+        timestamp. next_cursor is None on the last page.
+        """
+        columns = list(fields) if fields else list(COLUMNS)
+        conditions = []
+        params = []
+        if cursor is not None:
+            conditions.append("id > ?")
+            params.append(cursor)
+        if query_hash:
+            conditions.append("query_hash = ?")
+            params.append(query_hash)
+        if segment:
+            escaped = segment.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("segment_name LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        if since:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("timestamp <= ?")
+            params.append(until)
+
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        # Fetch one extra row to learn whether another page exists
+        sql = (
+            f"SELECT {', '.join(['id'] + [column for column in columns if column != 'id'])} "
+            f"FROM analysis_cache {where}ORDER BY id LIMIT ?"
+        )
+        try:
+            rows = self._connect().execute(sql, params + [limit + 1]).fetchall()
+            # Only the projected columns are fetched, so omitted blobs are never decompressed
+            personas = self._unpack_records([self._row_to_dict(row, columns) for row in rows[:limit]])
+        except Exception as e:
+            print(f"Error listing personas: {str(e)}")
+            return [], None
+
+        next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+        return personas, next_cursor
+
+    def get_last_row_id(self):
+        """Return the id of the newest analysis row; it changes whenever a row is added."""
+        try:
+            row = self._connect().execute("SELECT MAX(id) AS last_id FROM analysis_cache").fetchone()
+            return row['last_id'] or 0
+        except Exception as e:
+            print(f"Error reading analysis cache version: {str(e)}")
+            return None
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class FetchError(Exception):
+    """Raised when a URL cannot be fetched within the configured limits."""
+
+
+class FetchResult:
+    """Body and metadata of a fetched URL."""
+
+    def __init__(self, url, status_code, content, headers, encoding=None, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.encoding = encoding
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+
+class Fetcher:
+    """Shared HTTP fetcher with connection pooling, timeouts and a download size cap.
+
+    Concurrent fetches of the same URL share one download, and successful
+    responses carrying an ETag or Last-Modified header are revalidated with a
+    conditional GET on repeat requests.
+    """
+
+    def __init__(self, connect_timeout=5, read_timeout=15, max_seconds=30, max_bytes=10 * 1024 * 1024,
+                 pool_size=20, cache_entries=128, cache_bytes=64 * 1024 * 1024):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.cache_entries = cache_entries
+        self.cache_bytes = cache_bytes
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = 'Mozilla/5.0 (compatible; QuickAdCreation/1.0)'
+
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, url):
+        """Fetch a URL, joining an identical fetch already in progress."""
+        with self._lock:
+            future = self._in_flight.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[url] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._fetch(url)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(url, None)
+
+    def _fetch(self, url):
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached:
+                self._cache.move_to_end(url)
+
+        headers = {}
+        if cached:
+            if cached.headers.get('ETag'):
+                headers['If-None-Match'] = cached.headers['ETag']
+            if cached.headers.get('Last-Modified'):
+                headers['If-Modified-Since'] = cached.headers['Last-Modified']
+
+        try:
+            response = self.session.get(
+                url,
+                headers=headers,
+                timeout=(self.connect_timeout, self.read_timeout),
+                stream=True
+            )
+        except requests.RequestException as e:
+            raise FetchError(str(e))
+
+        try:
+            if response.status_code == 304 and cached:
+                return FetchResult(url, 200, cached.content, cached.headers, cached.encoding, from_cache=True)
+
+            content = self._read_capped(response)
+            result = FetchResult(
+                url, response.status_code, content, dict(response.headers), response.encoding
+            )
+        finally:
+            response.close()
+
+        if result.status_code == 200 and (result.headers.get('ETag') or result.headers.get('Last-Modified')):
+            self._store(url, result)
+
+        return result
+
+    def _read_capped(self, response):
+        """Read the streamed body, stopping at the byte cap or the overall time budget."""
+        declared = response.headers.get('Content-Length')
+        if declared and declared.isdigit() and int(declared) > self.max_bytes:
+            raise FetchError(f"Response too large ({declared} bytes, limit {self.max_bytes})")
+
+        started = time.monotonic()
+        chunks = []
+        size = 0
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise FetchError(f"Response too large (limit {self.max_bytes} bytes)")
+                if time.monotonic() - started > self.max_seconds:
+                    raise FetchError(f"Download took longer than {self.max_seconds}s")
+                chunks.append(chunk)
+        except requests.RequestException as e:
+            raise FetchError(str(e))
+        return b''.join(chunks)
+
+    def _store(self, url, result):
+        if len(result.content) > self.cache_bytes:
+            return
+        with self._lock:
+            previous = self._cache.pop(url, None)
+            if previous:
+                self._cache_size -= len(previous.content)
+            self._cache[url] = result
+            self._cache_size += len(result.content)
+            while len(self._cache) > self.cache_entries or self._cache_size > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_size -= len(evicted.content)
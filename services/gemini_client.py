@@ -0,0 +1,207 @@
+import random
+import threading
+import time
+from contextlib import nullcontext
+from services import metrics
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_MARKERS = ('RESOURCE_EXHAUSTED', 'UNAVAILABLE', 'DEADLINE_EXCEEDED', 'INTERNAL', 'timed out', 'Timeout')
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while the circuit breaker is open."""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Block until amount tokens are available, then take them."""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def debit(self, amount):
+        """Charge tokens after the fact (e.g. response tokens); the balance may go negative."""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures and lets one trial call through after cooldown."""
+
+    def __init__(self, failure_threshold=5, cooldown=30):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown or self._trial_in_flight:
+                raise CircuitOpenError("Gemini API circuit breaker is open after repeated failures")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    metrics.llm_circuit_opened.inc()
+                self.opened_at = time.monotonic()
+
+
+def is_retryable(error):
+    """Whether an API error is worth retrying (rate limits, server errors, timeouts)."""
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    message = str(error)
+    return any(marker in message for marker in RETRYABLE_MARKERS) or '429' in message or '503' in message
+
+
+def is_timeout(error):
+    """Whether an API error is a request timeout."""
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    if isinstance(code, int):
+        return code in (408, 504)
+    if isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__:
+        return True
+    message = str(error)
+    return 'timed out' in message or 'DEADLINE_EXCEEDED' in message
+
+
+def _has_call_timeout(config):
+    http_options = getattr(config, 'http_options', None)
+    return bool(getattr(http_options, 'timeout', None))
+
+
+class LazyClient:
+    """Build the underlying client with factory on first use.
+
+    Keeps the google-genai import and client construction out of startup, and
+    out of a pre-fork server master, so each worker creates its own client.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
+
+
+class _GovernedModels:
+    def __init__(self, governed_client):
+        self._governed_client = governed_client
+
+    def generate_content(self, model, contents, config=None):
+        return self._governed_client.generate_content(model=model, contents=contents, config=config)
+
+
+class GovernedClient:
+    """Wrap a genai client with rate limiting, an in-flight cap, retries and a circuit breaker.
+
+    requests_per_minute and tokens_per_minute feed token buckets and
+    max_in_flight caps concurrent calls (0 disables each of them); prompt tokens are estimated before the call and response tokens are
+    charged from usage metadata afterwards. Retryable errors are retried up to
+    max_retries times with exponential backoff and full jitter, except timeouts
+    of calls that set their own http_options.timeout: their caller has a
+    deadline built on that timeout and would discard a late answer.
+    """
+
+    def __init__(self, client, requests_per_minute=0, tokens_per_minute=0, max_in_flight=8,
+                 max_retries=3, base_delay=1.0, max_delay=30.0, failure_threshold=5, cooldown=30):
+        self._client = client
+        self.models = _GovernedModels(self)
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else nullcontext()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self._random = random.Random()
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _estimate_prompt_tokens(self, contents):
+        chars = sum(len(part) for part in contents if isinstance(part, str))
+        # Images are billed at a flat rate of roughly 258 tokens
+        images = sum(1 for part in contents if not isinstance(part, str))
+        return chars // 4 + images * 258
+
+    def _call_once(self, model, contents, config):
+        if self.request_bucket:
+            self.request_bucket.acquire()
+        if self.token_bucket:
+            self.token_bucket.acquire(self._estimate_prompt_tokens(contents))
+
+        with self.in_flight:
+            response = self._client.models.generate_content(model=model, contents=contents, config=config)
+
+        usage = getattr(response, 'usage_metadata', None)
+        if self.token_bucket and usage is not None:
+            self.token_bucket.debit(getattr(usage, 'candidates_token_count', None) or 0)
+        return response
+
+    def generate_content(self, model, contents, config=None):
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                response = self._call_once(model, contents, config)
+            except Exception as e:
+                if not is_retryable(e):
+                    # The API answered; a bad request says nothing about its health
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.max_retries or (is_timeout(e) and _has_call_timeout(config)):
+                    raise
+                attempt += 1
+                metrics.llm_retries.inc(model=model)
+                delay = self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return response
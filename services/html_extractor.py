@@ -0,0 +1,157 @@
+import re
+from html.parser import HTMLParser
+
+# Elements whose content is never useful product copy
+SKIP_TAGS = {
+    'script', 'style', 'noscript', 'svg', 'template', 'iframe', 'canvas',
+    'nav', 'footer', 'header', 'aside', 'form', 'button', 'select'
+}
+BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'main', 'li', 'ul', 'ol', 'br', 'tr', 'table',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'dd', 'dt', 'figcaption'
+}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+META_FIELDS = {
+    'description': 'description',
+    'og:description': 'description',
+    'og:title': 'title',
+    'og:site_name': 'site_name',
+    'keywords': 'keywords'
+}
+
+# Rough characters-per-token ratio for English text
+CHARS_PER_TOKEN = 4
+
+
+class _ContentParser(HTMLParser):
+    """Collect readable text and page metadata, skipping boilerplate elements."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.metadata = {}
+        self.blocks = []
+        self.main_blocks = []
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._in_title = False
+        self._title = []
+        self._current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'meta':
+            attrs = dict(attrs)
+            name = (attrs.get('name') or attrs.get('property') or '').lower()
+            field = META_FIELDS.get(name)
+            if field and attrs.get('content') and field not in self.metadata:
+                self.metadata[field] = attrs['content'].strip()
+            return
+        if tag in VOID_TAGS:
+            if tag == 'br':
+                self._flush()
+            return
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in ('main', 'article'):
+            self._flush()
+            self._main_depth += 1
+        elif tag == 'title':
+            self._in_title = True
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in ('main', 'article'):
+            self._flush()
+            self._main_depth = max(0, self._main_depth - 1)
+        elif tag == 'title':
+            self._in_title = False
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title.append(data)
+        elif not self._skip_depth:
+            self._current.append(data)
+
+    def _flush(self):
+        text = ' '.join(''.join(self._current).split())
+        self._current = []
+        if not text:
+            return
+        self.blocks.append(text)
+        if self._main_depth:
+            self.main_blocks.append(text)
+
+    def close(self):
+        super().close()
+        self._flush()
+        title = ' '.join(''.join(self._title).split())
+        if title:
+            self.metadata.setdefault('title', title)
+
+
+def estimate_tokens(text):
+    """Fast local token estimate (about four characters per token)."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_budget(text, max_tokens):
+    """Cut text to roughly max_tokens, preferring a paragraph or sentence boundary."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+
+    cut = text[:max_chars]
+    for boundary in ('\n', '. '):
+        index = cut.rfind(boundary)
+        if index > max_chars * 0.8:
+            return cut[:index + 1].rstrip()
+    return cut.rstrip()
+
+
+def extract_page_content(html, url=None, max_tokens=4000):
+    """Turn a web page into compact readable text for the model.
+
+    Scripts, styles, navigation and other boilerplate are dropped; when the page
+    marks up a <main> or <article> region with enough text only that region is
+    kept. The title and description metadata go first and the result is capped
+    to max_tokens using estimate_tokens.
+    """
+    parser = _ContentParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        print(f"Error parsing HTML: {str(e)}")
+
+    blocks = parser.blocks
+    if sum(len(block) for block in parser.main_blocks) > 200:
+        blocks = parser.main_blocks
+
+    # Drop exact repeats (menus, cookie banners and repeated CTAs)
+    seen = set()
+    unique_blocks = []
+    for block in blocks:
+        key = block.lower()
+        if key not in seen:
+            seen.add(key)
+            unique_blocks.append(block)
+
+    header = []
+    if url:
+        header.append(url)
+    for label, field in (('Title', 'title'), ('Site', 'site_name'), ('Description', 'description'),
+                         ('Keywords', 'keywords')):
+        if parser.metadata.get(field):
+            header.append(f"{label}: {parser.metadata[field]}")
+
+    text = '\n'.join(header)
+    body = '\n'.join(unique_blocks)
+    if body:
+        text = f"{text}\n\n{body}" if text else body
+
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return truncate_to_budget(text, max_tokens)
@@ -0,0 +1,75 @@
+import hashlib
+from io import BytesIO
+
+
+def perceptual_hash(image, hash_size=8):
+    """Difference hash (dHash) of an image as a 16-character hex string."""
+    from PIL import Image
+    grayscale = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(grayscale.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def preprocess_image(image_data, max_edge=1536, max_pixels=50_000_000, quality=85):
+    """Validate, decode once, downscale and re-encode an uploaded image.
+
+    Returns (result, error). result holds the compact re-encoded bytes and their
+    mime_type, the final width/height, a sha256 content_hash of the original
+    upload and a perceptual_hash of the picture. EXIF metadata is dropped after
+    applying its orientation. Images over max_pixels are rejected before their
+    pixel data is decoded.
+    """
+    # Imported on first use to keep Pillow out of startup
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(BytesIO(image_data))
+    except Image.DecompressionBombError as e:
+        return None, f"Image too large: {str(e)}"
+    except Exception as e:
+        return None, f"Unsupported image: {str(e)}"
+
+    try:
+        width, height = image.size
+        if width * height > max_pixels:
+            return None, f"Image too large: {width}x{height} exceeds {max_pixels} pixels"
+
+        # JPEG can decode straight at a reduced scale
+        if image.format == 'JPEG' and max(width, height) > max_edge:
+            scale = max_edge / max(width, height)
+            image.draft('RGB', (int(width * scale), int(height * scale)))
+
+        image.load()
+        image = ImageOps.exif_transpose(image)
+
+        if max(image.size) > max_edge:
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        output = BytesIO()
+        if has_alpha:
+            image = image.convert('RGBA')
+            image.save(output, 'PNG', optimize=True)
+            mime_type = 'image/png'
+        else:
+            image = image.convert('RGB')
+            image.save(output, 'JPEG', quality=quality, optimize=True)
+            mime_type = 'image/jpeg'
+
+        return {
+            'bytes': output.getvalue(),
+            'mime_type': mime_type,
+            'width': image.width,
+            'height': image.height,
+            'content_hash': hashlib.sha256(image_data).hexdigest(),
+            'perceptual_hash': perceptual_hash(image)
+        }, None
+
+    except Exception as e:
+        return None, f"Error processing image: {str(e)}"
@@ -0,0 +1,159 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation was requested."""
+
+
+class JobQueue:
+    """In-process job queue running stage generators on a background thread pool.
+
+    A job function is a generator yielding (stage, data) events. Each event is
+    kept as a partial result; ('result', data) completes the job and
+    ('error', message) fails it. Cancellation is checked between stages.
+
+    With a store (CacheService), every status change is published to it so
+    that, under a multi-process server, any worker can report on or cancel a
+    job that another worker is running.
+    """
+
+    def __init__(self, max_workers=2, retention=3600, store=None):
+        self.retention = retention
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_func, *args, **kwargs):
+        """Queue a job and return its id immediately."""
+        self._prune()
+
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'status': 'queued',
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'partial': {},
+            'result': None,
+            'error': None,
+            'cancel_requested': False,
+            'future': None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        self._publish(job)
+        job['future'] = self._executor.submit(self._run, job, job_func, args, kwargs)
+        return job_id
+
+    def _cancel_requested(self, job):
+        if job['cancel_requested']:
+            return True
+        if self.store is not None and self.store.job_cancel_requested(job['job_id']):
+            job['cancel_requested'] = True
+            return True
+        return False
+
+    def _run(self, job, job_func, args, kwargs):
+        if self._cancel_requested(job):
+            self._finish(job, 'cancelled')
+            return
+        with self._lock:
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+        self._publish(job)
+
+        try:
+            for stage, data in job_func(*args, **kwargs):
+                if self._cancel_requested(job):
+                    raise JobCancelled()
+                if stage == 'error':
+                    self._finish(job, 'failed', error=data)
+                    return
+                if stage == 'result':
+                    self._finish(job, 'completed', result=data)
+                    return
+                with self._lock:
+                    job['partial'][stage] = data
+                self._publish(job)
+            self._finish(job, 'completed')
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            self._finish(job, 'failed', error=f"Job failed: {str(e)}")
+
+    def _finish(self, job, status, result=None, error=None):
+        with self._lock:
+            job['status'] = status
+            job['result'] = result
+            job['error'] = error
+            job['finished_at'] = time.time()
+        self._publish(job)
+
+    def _snapshot(self, job):
+        with self._lock:
+            return {
+                'job_id': job['job_id'],
+                'status': job['status'],
+                'created_at': job['created_at'],
+                'started_at': job['started_at'],
+                'finished_at': job['finished_at'],
+                'partial': dict(job['partial']),
+                'result': job['result'],
+                'error': job['error']
+            }
+
+    def _publish(self, job):
+        if self.store is not None:
+            self.store.save_job(self._snapshot(job))
+
+    def get(self, job_id):
+        """Return the public status of a job, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return self._snapshot(job)
+        if self.store is not None:
+            return self.store.load_job(job_id)
+        return None
+
+    def cancel(self, job_id):
+        """Request cancellation; queued jobs never start, running jobs stop at the next stage."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            # Owned by another process: flag it and let that process stop it
+            remote = self.store.load_job(job_id) if self.store is not None else None
+            if remote is None or remote['status'] in ('completed', 'failed', 'cancelled'):
+                return False
+            self.store.request_job_cancel(job_id)
+            return True
+
+        with self._lock:
+            if job['status'] in ('completed', 'failed', 'cancelled'):
+                return False
+            job['cancel_requested'] = True
+            if job['status'] == 'queued':
+                job['status'] = 'cancelled'
+                job['finished_at'] = time.time()
+        self._publish(job)
+        if job['future'] is not None:
+            job['future'].cancel()
+        return True
+
+    def _prune(self):
+        """Drop finished jobs older than the retention window."""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job['finished_at'] and job['finished_at'] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.store is not None:
+            self.store.prune_jobs(cutoff)
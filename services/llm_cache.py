@@ -0,0 +1,241 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from services import metrics
+
+
+def make_cache_key(model, contents, config=None, namespace=None):
+    """Hash the model name, prompt parts, image bytes and generation config into a cache key.
+
+    namespace (e.g. the prompt registry version) separates otherwise identical
+    calls, so entries from older prompt versions are never served.
+    """
+    # Until something has imported Pillow, no part can be a PIL image
+    pil_image = sys.modules.get('PIL.Image')
+    digest = hashlib.sha256()
+    if namespace:
+        digest.update(f"namespace:{namespace}\n".encode())
+    digest.update(f"model:{model}\n".encode())
+
+    for part in contents:
+        if isinstance(part, str):
+            digest.update(b"text:")
+            digest.update(part.encode())
+        elif pil_image is not None and isinstance(part, pil_image.Image):
+            digest.update(f"image:{part.mode}:{part.size}:".encode())
+            digest.update(part.tobytes())
+        elif getattr(part, 'inline_data', None) is not None:
+            digest.update(f"blob:{part.inline_data.mime_type}:".encode())
+            digest.update(part.inline_data.data)
+        elif isinstance(part, (bytes, bytearray)):
+            digest.update(b"bytes:")
+            digest.update(part)
+        else:
+            digest.update(f"part:{part!r}".encode())
+        digest.update(b"\n")
+
+    if config is not None:
+        # Transport settings such as timeouts do not change the response
+        digest.update(b"config:")
+        digest.update(config.model_dump_json(exclude_none=True, exclude={'http_options'}).encode())
+
+    return digest.hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU cache with a TTL and an entry/byte budget."""
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, payload = entry
+            if self.ttl and time.time() - stored_at > self.ttl:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time(), payload)
+            self._size += len(payload)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, payload = self._entries.pop(key)
+        self._size -= len(payload)
+
+
+class DiskBackend:
+    """On-disk cache storing one file per key, evicting the least recently used files past max_bytes.
+
+    A file's mtime is its write time, which the TTL is measured from; its
+    atime is set on every hit and orders eviction.
+    """
+
+    def __init__(self, cache_dir='cache/llm', max_bytes=512 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            written = os.path.getmtime(path)
+            if self.ttl and time.time() - written > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                payload = f.read()
+            # Mark the file as recently used for eviction, keeping its write time
+            os.utime(path, (time.time(), written))
+            return payload
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, payload):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            files = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.pkl'):
+                    stat = entry.stat()
+                    files.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(files):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+
+class _CachedModels:
+    def __init__(self, cached_client, refresh=False):
+        self._cached_client = cached_client
+        self._refresh = refresh
+
+    def generate_content(self, model, contents, config=None):
+        return self._cached_client.generate_content(model=model, contents=contents, config=config,
+                                                    refresh=self._refresh)
+
+
+class _RefreshingClient:
+    """View of a CachedClient that always calls the API and stores the new responses."""
+
+    def __init__(self, cached_client):
+        self._cached_client = cached_client
+        self.models = _CachedModels(cached_client, refresh=True)
+
+    def __getattr__(self, name):
+        return getattr(self._cached_client, name)
+
+
+class CachedClient:
+    """Wrap a genai client so identical generate_content calls are served from a cache backend."""
+
+    def __init__(self, client, backend=None, namespace=None):
+        self._client = client
+        self.backend = backend or MemoryBackend()
+        self.namespace = namespace
+        self.models = _CachedModels(self)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def refreshing(self):
+        """Return a view of this client that skips cache reads but still caches what it gets back."""
+        return _RefreshingClient(self)
+
+    def generate_content(self, model, contents, config=None, refresh=False):
+        key = make_cache_key(model, contents, config, self.namespace)
+
+        payload = None if refresh else self.backend.get(key)
+        if payload is not None:
+            try:
+                response = pickle.loads(payload)
+                with self._lock:
+                    self.hits += 1
+                metrics.record_cache_lookup(hit=True)
+                return response
+            except Exception as e:
+                print(f"Error loading cached response: {str(e)}")
+
+        if not refresh:
+            with self._lock:
+                self.misses += 1
+            metrics.record_cache_lookup(hit=False)
+
+        response = self._client.models.generate_content(model=model, contents=contents, config=config)
+
+        # Only keep responses that actually produced output
+        if response.candidates:
+            try:
+                self.backend.set(key, pickle.dumps(response))
+            except Exception as e:
+                print(f"Error caching response: {str(e)}")
+
+        return response
+
+    def stats(self):
+        """Return hit/miss counters for the cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+
+def create_backend(kind='memory', cache_dir='cache/llm', max_bytes=None, ttl=None):
+    """Build a cache backend by name ('memory', 'disk' or 'none')."""
+    if kind == 'none':
+        return None
+    kwargs = {}
+    if max_bytes:
+        kwargs['max_bytes'] = max_bytes
+    if ttl:
+        kwargs['ttl'] = ttl
+    if kind == 'disk':
+        return DiskBackend(cache_dir=cache_dir, **kwargs)
+    return MemoryBackend(**kwargs)
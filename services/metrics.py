@@ -0,0 +1,364 @@
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    pairs = list(label_key) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        _ensure_writer()
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self, snapshots=None):
+        values = {}
+        for snapshot in snapshots or [self.snapshot()]:
+            for key, value in snapshot:
+                key = tuple(tuple(pair) for pair in key)
+                values[key] = values.get(key, 0) + value
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        _ensure_writer()
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), dict(series, counts=list(series['counts']))] for key, series in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self, snapshots=None):
+        values = {}
+        for snapshot in snapshots or [self.snapshot()]:
+            for key, series in snapshot:
+                key = tuple(tuple(pair) for pair in key)
+                merged = values.setdefault(key, {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+                merged['counts'] = [total + count for total, count in zip(merged['counts'], series['counts'])]
+                merged['sum'] += series['sum']
+                merged['count'] += series['count']
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(values.items()):
+            for bound, count in zip(self.buckets, series['counts']):
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+stage_duration = Histogram('analysis_stage_duration_seconds', 'Wall time of each analysis pipeline stage.')
+stage_errors = Counter('analysis_stage_errors_total', 'Pipeline stages that raised or reported an error.')
+request_duration = Histogram('http_request_duration_seconds', 'Wall time of HTTP requests by endpoint.')
+llm_duration = Histogram('gemini_request_duration_seconds', 'Wall time of generate_content calls sent to the API.')
+llm_requests = Counter('gemini_requests_total', 'generate_content calls sent to the API by outcome.')
+llm_prompt_chars = Histogram('gemini_prompt_chars', 'Characters of text sent per generate_content call.', SIZE_BUCKETS)
+llm_response_chars = Histogram('gemini_response_chars', 'Characters of text returned per generate_content call.', SIZE_BUCKETS)
+llm_tokens = Counter('gemini_tokens_total', 'Tokens reported in response usage metadata.')
+llm_retries = Counter('gemini_retries_total', 'generate_content attempts retried after a retryable error.')
+llm_circuit_opened = Counter('gemini_circuit_opened_total', 'Times the API circuit breaker opened.')
+llm_cache_requests = Counter('llm_cache_requests_total', 'Response cache lookups by result.')
+
+REGISTRY = [
+    stage_duration, stage_errors, request_duration, llm_duration, llm_requests,
+    llm_prompt_chars, llm_response_chars, llm_tokens, llm_retries, llm_circuit_opened, llm_cache_requests
+]
+
+
+# Multi-process mode: every process writes its values to <dir>/<pid>.json and
+# a scrape sums the files, so any worker reports totals for the whole server
+_multiprocess = {'dir': None, 'interval': 5.0, 'pid': None}
+_writer_lock = threading.Lock()
+
+
+def configure_multiprocess(directory, interval=5.0):
+    """Aggregate metrics across server processes through files in directory.
+
+    Each process rewrites its own file every interval seconds, at exit and
+    when it answers a scrape. Files of exited processes are kept, so totals
+    never go backwards while the server runs; clear the directory when the
+    server starts (gunicorn.conf.py does).
+    """
+    os.makedirs(directory, exist_ok=True)
+    _multiprocess['dir'] = directory
+    _multiprocess['interval'] = interval
+
+
+def clear_multiprocess(directory):
+    """Remove every process's metrics file, e.g. before a server starts."""
+    if not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json'):
+            os.remove(entry.path)
+
+
+def _write_snapshot():
+    directory = _multiprocess['dir']
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump({metric.name: metric.snapshot() for metric in REGISTRY}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error writing metrics snapshot: {str(e)}")
+
+
+def _writer_loop():
+    while True:
+        time.sleep(_multiprocess['interval'])
+        _write_snapshot()
+
+
+def _ensure_writer():
+    """Start this process's snapshot writer on its first metric update.
+
+    A forked worker inherits its parent's values, which are already counted in
+    the parent's file, so it starts from zero with a writer of its own.
+    """
+    pid = os.getpid()
+    if _multiprocess['dir'] is None or _multiprocess['pid'] == pid:
+        return
+    with _writer_lock:
+        if _multiprocess['pid'] == pid:
+            return
+        if _multiprocess['pid'] is not None:
+            for metric in REGISTRY:
+                metric.reset()
+        _multiprocess['pid'] = pid
+        threading.Thread(target=_writer_loop, name='metrics-writer', daemon=True).start()
+        atexit.register(_write_snapshot)
+
+
+def _read_snapshots():
+    snapshots = {metric.name: [] for metric in REGISTRY}
+    for entry in os.scandir(_multiprocess['dir']):
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            with open(entry.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, snapshot in data.items():
+            if name in snapshots:
+                snapshots[name].append(snapshot)
+    return snapshots
+
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format.
+
+    In multi-process mode the values are summed over every process's file.
+    """
+    snapshots = {}
+    if _multiprocess['dir'] is not None:
+        _ensure_writer()
+        _write_snapshot()
+        snapshots = _read_snapshots()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(snapshots.get(metric.name)))
+    return '\n'.join(lines) + '\n'
+
+
+class Trace:
+    """Per-request record of stage timings and model calls."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds, error=None):
+        with self._lock:
+            self.stages.append({'stage': stage, 'seconds': round(seconds, 4), 'error': error})
+
+    def add_call(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def summary(self):
+        with self._lock:
+            return {
+                'total_seconds': round(time.perf_counter() - self.started, 4),
+                'stages': list(self.stages),
+                'model_calls': len([call for call in self.calls if not call.get('cache_hit')]),
+                'cache_hits': len([call for call in self.calls if call.get('cache_hit')]),
+                'prompt_tokens': sum(call.get('prompt_tokens') or 0 for call in self.calls),
+                'response_tokens': sum(call.get('response_tokens') or 0 for call in self.calls),
+                'calls': list(self.calls)
+            }
+
+
+_current_trace = contextvars.ContextVar('analysis_trace', default=None)
+
+
+def start_trace():
+    """Begin collecting a per-request trace in the current context."""
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def clear_trace():
+    """Stop collecting into the current context's trace.
+
+    Server threads are reused across requests, so each request starts by
+    clearing the trace a previous request may have left behind.
+    """
+    _current_trace.set(None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def observe_stage(stage, seconds, error=None):
+    """Record one run of a pipeline stage in the stage metrics and the current trace."""
+    stage_duration.observe(seconds, stage=stage)
+    if error:
+        stage_errors.inc(stage=stage)
+    trace = current_trace()
+    if trace is not None:
+        trace.add_stage(stage, seconds, error)
+
+
+@contextmanager
+def timed_stage(stage):
+    """Time a block as a pipeline stage; an exception is recorded as the stage's error."""
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started, error)
+
+
+def record_cache_lookup(hit):
+    llm_cache_requests.inc(result='hit' if hit else 'miss')
+    trace = current_trace()
+    if trace is not None and hit:
+        trace.add_call({'cache_hit': True})
+
+
+def _prompt_chars(contents):
+    return sum(len(part) for part in contents if isinstance(part, str))
+
+
+def _response_chars(response):
+    try:
+        return sum(len(part.text or '') for part in response.candidates[0].content.parts)
+    except Exception:
+        return 0
+
+
+class _InstrumentedModels:
+    def __init__(self, instrumented_client):
+        self._instrumented_client = instrumented_client
+
+    def generate_content(self, model, contents, config=None):
+        return self._instrumented_client.generate_content(model=model, contents=contents, config=config)
+
+
+class InstrumentedClient:
+    """Wrap a genai client to record latency, sizes, token usage and errors for every call."""
+
+    def __init__(self, client):
+        self._client = client
+        self.models = _InstrumentedModels(self)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def generate_content(self, model, contents, config=None):
+        started = time.perf_counter()
+        call = {'model': model, 'prompt_chars': _prompt_chars(contents)}
+        try:
+            response = self._client.models.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            call['error'] = str(e)
+            llm_requests.inc(model=model, status='error')
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            call['seconds'] = round(elapsed, 4)
+            llm_duration.observe(elapsed, model=model)
+            llm_prompt_chars.observe(call['prompt_chars'], model=model)
+            trace = current_trace()
+            if trace is not None:
+                trace.add_call(call)
+
+        llm_requests.inc(model=model, status='ok')
+        call['response_chars'] = _response_chars(response)
+        llm_response_chars.observe(call['response_chars'], model=model)
+
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            call['prompt_tokens'] = getattr(usage, 'prompt_token_count', None) or 0
+            call['response_tokens'] = getattr(usage, 'candidates_token_count', None) or 0
+            llm_tokens.inc(call['prompt_tokens'], model=model, type='prompt')
+            llm_tokens.inc(call['response_tokens'], model=model, type='response')
+
+        return response
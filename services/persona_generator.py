@@ -1,138 +1,314 @@
-from google.genai.types import Tool, GenerateContentConfig, GoogleSearch
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from services.segment_parser import parse_segments
+from services import metrics
+from services.prompts import get_prompt, product_context
 
-def generate_personas(segments, product_details, client=None):
-    """Generate detailed personas for each customer segment."""
+def _persona_prompt(segment_name, value_proposition):
+    return get_prompt('persona').render(segment_name=segment_name, value_proposition=value_proposition)
+
+
+def _video_prompt(video_context, segment_name, value_proposition, persona, tone=None):
+    """video_context is the video_prompt template bound to the request's product context."""
+    prompt = video_context.render(segment_name=segment_name, value_proposition=value_proposition, persona=persona)
+    if tone:
+        prompt += get_prompt('video_tone').render(tone=tone)
+    return prompt
+
+
+def _batch_prompt(segments, product_description, include_video_prompts):
+    segment_lines = "\n".join(
+        f"- Segment: {segment['name']}\n  Value Proposition & Characteristics: {segment['value_proposition']}"
+        for segment in segments
+    )
+    prompt = get_prompt('persona_batch').render(segment_lines=segment_lines)
+    if include_video_prompts:
+        prompt += get_prompt('persona_batch_video').render(product_description=product_description)
+    return prompt + get_prompt('persona_batch_footer').render()
+
+
+def _generation_config(timeout=None, grounded=True):
+    """Build the generation config, search-grounded by default, with an optional per-call timeout in seconds."""
+    # Imported on first use; google-genai adds most of the app's startup time
+    from google.genai.types import Tool, GenerateContentConfig, GoogleSearch, HttpOptions
+
+    return GenerateContentConfig(
+        tools=[Tool(google_search=GoogleSearch())] if grounded else None,
+        response_modalities=["TEXT"],
+        http_options=HttpOptions(timeout=int(timeout * 1000)) if timeout else None,
+    )
+
+
+def _batch_config(include_video_prompts, timeout=None):
+    """Structured-output config for batched generation; JSON mode cannot be combined with search tools."""
+    from google.genai.types import GenerateContentConfig, HttpOptions, Schema, Type
+
+    properties = {
+        'segment_name': Schema(type=Type.STRING),
+        'persona': Schema(type=Type.STRING)
+    }
+    if include_video_prompts:
+        properties['video_prompt'] = Schema(type=Type.STRING)
+    return GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=Schema(
+            type=Type.ARRAY,
+            items=Schema(type=Type.OBJECT, properties=properties, required=list(properties))
+        ),
+        http_options=HttpOptions(timeout=int(timeout * 1000)) if timeout else None,
+    )
+
+
+def _generate_video_prompt(segment_name, value_proposition, video_context, persona, client,
+                           timeout=None, video_grounding=True, tone=None):
+    """Generate the video ad prompt for a segment from its persona."""
+    try:
+        video_response = client.models.generate_content(
+            model="gemini-2.0-flash-exp",
+            contents=[_video_prompt(video_context, segment_name, value_proposition, persona, tone)],
+            config=_generation_config(timeout, grounded=video_grounding)
+        )
+
+        if video_response.candidates:
+            return video_response.candidates[0].content.parts[0].text
+        return "Failed to generate video prompt"
+
+    except Exception:
+        return "Error generating video prompt"
+
+
+def _generate_segment_persona(segment_name, value_proposition, video_context, client,
+                              timeout=None, video_grounding=True, tone=None):
+    """Generate the persona and then the video prompt for a single segment."""
+    try:
+        # Generate persona with grounding
+        response = client.models.generate_content(
+            model="gemini-2.0-flash-exp",
+            contents=[_persona_prompt(segment_name, value_proposition)],
+            config=_generation_config(timeout)
+        )
+
+        if not response.candidates:
+            return {
+                'persona': "Failed to generate persona",
+                'video_prompt': "Failed to generate video prompt"
+            }
+
+        persona = response.candidates[0].content.parts[0].text
+
+        # Generate video ad prompt based on the persona and segment context
+        return {
+            'persona': persona,
+            'video_prompt': _generate_video_prompt(
+                segment_name, value_proposition, video_context, persona, client,
+                timeout, video_grounding, tone
+            )
+        }
+
+    except Exception as e:
+        return {
+            'persona': f"Error generating persona: {str(e)}",
+            'video_prompt': "Error generating video prompt"
+        }
+
+
+def _generate_batched_personas(segments, product_description, client, include_video_prompts=True, timeout=None):
+    """Generate personas (and optionally video prompts) for all segments in one structured-output call.
+
+    Returns a dict of segment name to persona dict for the segments the model
+    answered; segments missing from the reply are left for per-segment calls.
+    """
     try:
+        response = client.models.generate_content(
+            model="gemini-2.0-flash-exp",
+            contents=[_batch_prompt(segments, product_description, include_video_prompts)],
+            config=_batch_config(include_video_prompts, timeout)
+        )
+        if not response.candidates:
+            return {}
+
+        entries = json.loads(response.candidates[0].content.parts[0].text)
+        wanted = {segment['name'] for segment in segments}
         personas = {}
-        
-        # Split by first level brackets
-        segments_list = segments.split('[')
-        
-        # Extract product description from the product details
-        product_description = product_details.get('description', "the product")
-        
-        for segment in segments_list[1::2]:  # Skip empty first split
-            try:
-                # Get segment name from first bracket
-                segment_name = segment.split(']')[0].strip()
-                
-                # Find the value proposition (text between the last set of square brackets)
-                value_prop_start = segment.rfind('[')
-                value_prop_end = segment.rfind(']')
-                
-                if value_prop_start != -1 and value_prop_end != -1:
-                    value_proposition = segment[value_prop_start+1:value_prop_end].strip()
-                else:
-                    value_proposition = ""
-                
-                persona_prompt = f"""Create a concise but detailed persona for this customer segment:
-
-Segment: {segment_name}
-Value Proposition & Characteristics: {value_proposition}
-
-Generate a rich persona that can be used as a prompt for an LLM to accurately simulate this customer segment. Include:
-
-1. Personal Background:
-   - Name, age, occupation aligned with segment demographics
-   - Income level and financial priorities
-   - Lifestyle and daily routine
-   - Location and living situation
-
-2. Psychological Profile:
-   - Core values and beliefs
-   - Key motivations and aspirations
-   - Main pain points and challenges
-   - Decision-making style
-   - Technology adoption level
-
-3. Shopping Behavior:
-   - Research and evaluation process
-   - Key decision factors when buying
-   - Price sensitivity
-   - Brand preferences and loyalty
-   - Response to marketing
-
-4. Product Expectations:
-   - Must-have features
-   - Quality expectations
-   - Price-to-value relationship
-   - Service expectations
-
-Format the response as a second-person narrative that can be used as an LLM prompt, starting with:
-"You are [name], a [age]-year-old [occupation]..."
-
-Make the persona concise but authentic, focusing on the most important characteristics that define their buying behavior."""
-
-                # Generate persona with grounding
-                response = client.models.generate_content(
-                    model="gemini-2.0-flash-exp",
-                    contents=[persona_prompt],
-                    config=GenerateContentConfig(
-                        tools=[Tool(google_search=GoogleSearch())],
-                        response_modalities=["TEXT"],
-                    )
-                )
-                
-                if not response.candidates:
-                    personas[segment_name] = {
-                        'persona': "Failed to generate persona",
-                        'video_prompt': "Failed to generate video prompt"
-                    }
-                    continue
+        for entry in entries:
+            segment_name = str(entry.get('segment_name', '')).strip()
+            if segment_name in wanted and entry.get('persona'):
+                personas[segment_name] = {
+                    'persona': entry['persona'],
+                    'video_prompt': entry.get('video_prompt') or None
+                }
+        return personas
+
+    except Exception as e:
+        print(f"Batched persona generation failed, falling back to per-segment calls: {str(e)}")
+        return {}
+
 
-                personas[segment_name] = response.candidates[0].content.parts[0].text
+FAILURE_PREFIXES = ('Failed to generate', 'Error generating')
 
-                # Generate video ad prompt based on the persona and segment context
-                video_prompt = f"""Create a concise 8-second video advertisement prompt targeting this customer segment. The prompt should start with:
 
-"This is an advertisement for {product_description}"
+def persona_failed(persona):
+    """Whether a generated persona entry records a failure rather than real output."""
+    if not isinstance(persona, dict):
+        return True
+    return any(
+        str(persona.get(field, '')).startswith(FAILURE_PREFIXES)
+        for field in ('persona', 'video_prompt')
+    )
 
-Target Segment: {segment_name}
-Key Value Proposition: {value_proposition}
 
-Based on the customer profile:
-{personas[segment_name]}
+def regenerate_segment(segment_name, value_proposition, product_description, client=None, persona=None,
+                       tone=None, timeout=None, video_grounding=True, product_context_tokens=None):
+    """Regenerate one segment without touching the others.
 
-Generate a focused video prompt with:
+    Passing the segment's existing persona text regenerates only the video
+    prompt (one model call); otherwise the persona and then its video prompt
+    are generated (two calls). tone optionally steers the video prompt.
+    Returns (persona_dict, error).
+    """
+    video_context = get_prompt('video_prompt').bind(
+        product_description=product_context(product_description, product_context_tokens)
+    )
+    if persona:
+        result = {
+            'persona': persona,
+            'video_prompt': _generate_video_prompt(
+                segment_name, value_proposition, video_context, persona, client,
+                timeout, video_grounding, tone
+            )
+        }
+    else:
+        result = _generate_segment_persona(
+            segment_name, value_proposition, video_context, client, timeout, video_grounding, tone
+        )
 
-1. Scene Sequence (8 seconds total):
-   - Opening (2s): Set the scene and hook
-   - Middle (4s): Show key benefit/feature
-   - Closing (2s): Call to action
+    if persona_failed(result):
+        return None, next(
+            value for value in (result['persona'], result['video_prompt'])
+            if str(value).startswith(FAILURE_PREFIXES)
+        )
+    return result, None
 
-2. Style Elements:
-   - Visual: Key imagery, colors, and mood for this demographic
-   - Audio: Music style and voice tone
-   - Product Integration: How to showcase the main benefit
 
-Keep the prompt concise and impactful, focusing on the most important elements that will resonate with this customer segment."""
+def iter_personas(segments, product_details, client=None, max_workers=1, timeout=None,
+                  batch_mode='off', video_grounding=True, completed=None, product_context_tokens=None):
+    """Yield (segment_name, persona) pairs as each segment finishes.
 
-                # Generate video prompt with grounding
-                video_response = client.models.generate_content(
-                    model="gemini-2.0-flash-exp",
-                    contents=[video_prompt],
-                    config=GenerateContentConfig(
-                        tools=[Tool(google_search=GoogleSearch())],
-                        response_modalities=["TEXT"],
-                    )
+    segments is the list of records from parse_segments (raw segments text is
+    parsed on the fly). With max_workers > 1 each segment runs as its own task
+    on a bounded thread pool. timeout (seconds) applies to every model call;
+    segments still running after two call timeouts per wave of workers are
+    reported as errors.
+
+    batch_mode 'personas' generates every persona in one structured-output
+    call and 'all' also includes the video prompts; segments the batched reply
+    does not cover fall back to per-segment calls. video_grounding=False drops
+    Google Search grounding from the video prompt step. Segments already in
+    completed (name -> persona, e.g. from a checkpoint) are yielded as-is.
+    product_context_tokens caps the product description sent with every
+    video prompt; it is rendered into the shared prompt prefix once.
+    """
+    # Extract product description from the product details
+    product_description = product_context(product_details.get('description', "the product"), product_context_tokens)
+    video_context = get_prompt('video_prompt').bind(product_description=product_description)
+
+    if isinstance(segments, str):
+        segments = parse_segments(segments)
+    completed = completed or {}
+    for segment in segments:
+        if segment['name'] in completed:
+            yield segment['name'], completed[segment['name']]
+    segments = [segment for segment in segments if segment['name'] not in completed]
+    segments_list = [(segment['name'], segment['value_proposition']) for segment in segments]
+
+    batched = {}
+    if batch_mode in ('personas', 'all') and segments_list:
+        with metrics.timed_stage('persona_batch'):
+            batched = _generate_batched_personas(
+                segments, product_description, client,
+                include_video_prompts=batch_mode == 'all', timeout=timeout
+            )
+
+    def run_segment(segment_name, value_proposition):
+        with metrics.timed_stage('persona_segment'):
+            persona = batched.get(segment_name)
+            if persona is None:
+                return _generate_segment_persona(
+                    segment_name, value_proposition, video_context, client, timeout, video_grounding
                 )
-                
-                if video_response.candidates:
-                    personas[segment_name] = {
-                        'persona': personas[segment_name],
-                        'video_prompt': video_response.candidates[0].content.parts[0].text
-                    }
-                else:
-                    personas[segment_name] = {
-                        'persona': personas[segment_name],
-                        'video_prompt': "Failed to generate video prompt"
-                    }
-
-            except Exception as e:
-                personas[segment_name] = {
-                    'persona': f"Error generating persona: {str(e)}",
+            persona['video_prompt'] = _generate_video_prompt(
+                segment_name, value_proposition, video_context, persona['persona'], client,
+                timeout, video_grounding
+            )
+            return persona
+
+    # Segments fully answered by the batched call need no further model calls
+    remaining = []
+    for segment_name, value_proposition in segments_list:
+        persona = batched.get(segment_name)
+        if persona and persona['video_prompt']:
+            yield segment_name, persona
+        else:
+            remaining.append((segment_name, value_proposition))
+    segments_list = remaining
+
+    if max_workers <= 1 or len(segments_list) <= 1:
+        for segment_name, value_proposition in segments_list:
+            yield segment_name, run_segment(segment_name, value_proposition)
+        return
+
+    workers = min(max_workers, len(segments_list))
+    deadline = None
+    if timeout:
+        waves = -(-len(segments_list) // workers)
+        deadline = 2 * timeout * waves
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            # Run in a copy of the caller's context so per-request tracing follows the task
+            executor.submit(
+                contextvars.copy_context().run, run_segment, segment_name, value_proposition
+            ): segment_name
+            for segment_name, value_proposition in segments_list
+        }
+        pending = set(futures)
+
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                pending.discard(future)
+                yield futures[future], future.result()
+        except FutureTimeoutError:
+            for future in pending:
+                future.cancel()
+                yield futures[future], {
+                    'persona': "Error generating persona: timed out",
                     'video_prompt': "Error generating video prompt"
                 }
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def generate_personas(segments, product_details, client=None, max_workers=1, timeout=None,
+                      batch_mode='off', video_grounding=True, product_context_tokens=None):
+    """Generate detailed personas for each customer segment.
+
+    Accepts the same concurrency and batching options as iter_personas; results
+    are always returned in segment order.
+    """
+    try:
+        if isinstance(segments, str):
+            segments = parse_segments(segments)
+
+        completed = dict(iter_personas(
+            segments, product_details, client, max_workers, timeout, batch_mode, video_grounding,
+            product_context_tokens=product_context_tokens
+        ))
+
+        personas = {}
+        for segment in segments:
+            personas[segment['name']] = completed[segment['name']]
 
         return personas, None
 
@@ -0,0 +1,313 @@
+import hashlib
+from string import Formatter
+from services.html_extractor import truncate_to_budget
+
+
+def _compile(template):
+    """Split a str.format-style template into (literal, field) pairs once, up front."""
+    return [(literal, field) for literal, field, _, _ in Formatter().parse(template)]
+
+
+def _render(compiled, values):
+    return ''.join(literal + (str(values[field]) if field is not None else '') for literal, field in compiled)
+
+
+class BoundPrompt:
+    """A template whose prefix was rendered once and is shared by many calls."""
+
+    def __init__(self, template, prefix):
+        self.template = template
+        self.prefix = prefix
+
+    def render(self, **values):
+        return self.prefix + _render(self.template._suffix, values)
+
+
+class PromptTemplate:
+    """A versioned prompt made of a static-first prefix and a per-call suffix.
+
+    Both parts are parsed once at import. Anything shared by several calls
+    belongs in the prefix so every call starts with the same text, which lets
+    the API reuse its cached prefix; bind() renders the prefix once for
+    values shared across a request (such as the product context used by
+    every segment's video prompt).
+    """
+
+    def __init__(self, name, version, prefix, suffix=''):
+        self.name = name
+        self.version = version
+        self._prefix = _compile(prefix)
+        self._suffix = _compile(suffix)
+        self._static_prefix = prefix if all(field is None for _, field in self._prefix) else None
+        self.fingerprint = hashlib.sha256(f"{name}:{version}\n{prefix}\0{suffix}".encode()).hexdigest()[:12]
+
+    def bind(self, **shared_values):
+        if self._static_prefix is not None:
+            return BoundPrompt(self, self._static_prefix)
+        return BoundPrompt(self, _render(self._prefix, shared_values))
+
+    def render(self, **values):
+        return self.bind(**values).render(**values)
+
+
+PROMPTS = {}
+
+
+def register(name, version, prefix, suffix=''):
+    PROMPTS[name] = PromptTemplate(name, version, prefix, suffix)
+    return PROMPTS[name]
+
+
+def get_prompt(name):
+    return PROMPTS[name]
+
+
+def product_context(description, max_tokens=None):
+    """The product description given to persona-level prompts, cut to max_tokens when set.
+
+    The detailed analysis leads with its product understanding, so its start
+    is what an advertisement needs; the market sizing that follows is left out.
+    """
+    if not max_tokens:
+        return description
+    return truncate_to_budget(description, max_tokens)
+
+
+PERSONA_INSTRUCTIONS = """Generate a rich persona that can be used as a prompt for an LLM to accurately simulate this customer segment. Include:
+
+1. Personal Background:
+   - Name, age, occupation aligned with segment demographics
+   - Income level and financial priorities
+   - Lifestyle and daily routine
+   - Location and living situation
+
+2. Psychological Profile:
+   - Core values and beliefs
+   - Key motivations and aspirations
+   - Main pain points and challenges
+   - Decision-making style
+   - Technology adoption level
+
+3. Shopping Behavior:
+   - Research and evaluation process
+   - Key decision factors when buying
+   - Price sensitivity
+   - Brand preferences and loyalty
+   - Response to marketing
+
+4. Product Expectations:
+   - Must-have features
+   - Quality expectations
+   - Price-to-value relationship
+   - Service expectations
+
+Format the response as a second-person narrative that can be used as an LLM prompt, starting with:
+"You are [name], a [age]-year-old [occupation]..."
+
+Make the persona concise but authentic, focusing on the most important characteristics that define their buying behavior."""
+
+VIDEO_PROMPT_INSTRUCTIONS = """Generate a focused video prompt with:
+
+1. Scene Sequence (8 seconds total):
+   - Opening (2s): Set the scene and hook
+   - Middle (4s): Show key benefit/feature
+   - Closing (2s): Call to action
+
+2. Style Elements:
+   - Visual: Key imagery, colors, and mood for this demographic
+   - Audio: Music style and voice tone
+   - Product Integration: How to showcase the main benefit
+
+Keep the prompt concise and impactful, focusing on the most important elements that will resonate with this customer segment."""
+
+register(
+    'detailed_analysis', 'v1',
+    """Analyze the provided product information and identify the customer segments with the highest revenue potential. 
+        
+Follow these steps in your analysis, ensuring all numbers and statistics are grounded in real-world market data:
+
+1. Product Understanding:
+   - Analyze the visual elements, features, and quality level from the image/description
+   - Identify key product attributes and value propositions
+   - Research and estimate a realistic price point based on:
+     * Similar products in the market
+     * Quality level and features
+     * Target market positioning
+     * Current market pricing trends
+
+2. Market Size Analysis:
+   - Research the total addressable market (TAM) using verifiable industry data
+   - Consider:
+     * Published market research reports
+     * Industry association statistics
+     * Public company financial reports
+     * Government economic data
+   - Document market growth trends with specific year-over-year rates
+   - Cross-reference multiple sources to validate market size estimates
+
+3. Customer Segmentation with Revenue Potential:
+   - For each potential customer segment, provide realistic estimates backed by data:
+     * Average purchase value (benchmark against actual market prices)
+     * Purchase frequency based on typical consumer behavior
+     * Segment size validated against demographic data
+     * Total potential annual revenue calculated conservatively
+   - Support each estimate with:
+     * Reference to similar products/markets
+     * Industry benchmarks
+     * Consumer spending patterns
+     * Market penetration rates
+   - Calculate percentage contribution to total revenue
+   - Only retain segments that fall in the top 80% of cumulative revenue
+
+4. Market Penetration Factors:
+   - Research actual customer acquisition costs in similar markets
+   - Analyze competitive landscape with specific examples
+   - Consider realistic barriers to entry
+   - Factor in market saturation levels
+
+Guidelines for Revenue Estimates:
+- Always err on the conservative side
+- Cross-reference numbers with industry benchmarks
+- Consider economic factors and purchasing power
+- Account for seasonal variations if applicable
+- Factor in market maturity and adoption rates
+- Consider regional differences in pricing and demand
+
+Provide a detailed analysis following these steps, with specific focus on realistic and well-researched revenue calculations."""
+)
+
+register(
+    'revenue_segments', 'v1',
+    """Extract and analyze the customer segments that contribute to the top 80% of total revenue potential.
+
+For each segment, provide realistic and well-researched metrics:
+
+1. Segment Name/Title (be specific about the demographic)
+
+2. Revenue Metrics (all numbers must be justified):
+   - Average Purchase Value:
+     * Base this on actual market prices
+     * Consider regional variations
+     * Account for typical discounts/promotions
+   
+   - Annual Purchase Frequency:
+     * Use realistic consumer behavior patterns
+     * Consider product lifecycle
+     * Account for seasonal variations
+   
+   - Segment Size:
+     * Base on demographic data
+     * Consider market penetration rates
+     * Account for geographic limitations
+   
+   - Total Annual Revenue Potential:
+     * Calculate conservatively
+     * Show clear multiplication steps
+     * Round down for safety
+
+3. Value Proposition:
+   - Clear rationale for revenue estimates
+   - Specific pain points addressed
+   - Competitive advantages
+   - Market positioning
+
+Format each segment EXACTLY as follows, with NO introductory text:
+[Segment Name - Primary Demographic]
+Revenue Potential: $X million/year (show calculation)
+- Avg Purchase: $X (reference similar products)
+- Frequency: X purchases/year (justify with behavior patterns)
+- Segment Size: X customers (cite demographic data)
+[Three-line description including:
+ - Value proposition
+ - Revenue justification
+ - Market positioning]
+
+[Next Segment]
+...etc.
+
+Important:
+- Order segments by revenue potential (highest to lowest)
+- Only include segments that together make up 80% of total revenue
+- Do NOT include any introductory text or summary before the segments
+- Start DIRECTLY with the first segment in [brackets]
+- Ensure all numbers are realistic and conservative
+
+Here's the analysis:
+""",
+    """{analysis}"""
+)
+
+# Instructions first and the segment last, so all N persona calls share one prefix
+register(
+    'persona', 'v2',
+    """Create a concise but detailed persona for the customer segment given at the end of this prompt.
+
+""" + PERSONA_INSTRUCTIONS + """
+
+""",
+    """Segment: {segment_name}
+Value Proposition & Characteristics: {value_proposition}"""
+)
+
+# The product context is part of the prefix: it is the same for every segment of a request
+register(
+    'video_prompt', 'v2',
+    """Create a concise 8-second video advertisement prompt targeting the customer segment given at the end of this prompt. The prompt should start with:
+
+"This is an advertisement for {product_description}"
+
+""" + VIDEO_PROMPT_INSTRUCTIONS + """
+
+""",
+    """Target Segment: {segment_name}
+Key Value Proposition: {value_proposition}
+
+Based on the customer profile:
+{persona}"""
+)
+
+register(
+    'video_tone', 'v1',
+    """
+
+Give the advertisement a {tone} tone."""
+)
+
+register(
+    'persona_batch', 'v1',
+    """Create a concise but detailed persona for EACH of these customer segments:
+
+{segment_lines}
+
+For every segment, write the persona as follows.
+
+""" + PERSONA_INSTRUCTIONS
+)
+
+register(
+    'persona_batch_video', 'v1',
+    """
+
+Then, for every segment, create a concise 8-second video advertisement prompt targeting that segment and based on its persona. Each video prompt should start with:
+
+"This is an advertisement for {product_description}"
+
+""" + VIDEO_PROMPT_INSTRUCTIONS
+)
+
+register(
+    'persona_batch_footer', 'v1',
+    """
+
+Return one entry per segment, using the segment name exactly as given above."""
+)
+
+# Changes whenever any template changes; part of every cache key for model output
+PROMPT_VERSION = hashlib.sha256(
+    ','.join(f"{name}:{template.fingerprint}" for name, template in sorted(PROMPTS.items())).encode()
+).hexdigest()[:12]
+
+
+def prompt_versions():
+    """Version and content fingerprint of every registered template."""
+    return {name: f"{template.version}-{template.fingerprint}" for name, template in PROMPTS.items()}
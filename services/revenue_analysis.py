@@ -1,64 +1,12 @@
-from google.genai.types import Tool, GenerateContentConfig, GoogleSearch
+from services.segment_parser import parse_segments
+from services.prompts import get_prompt
 
 def get_revenue_segments(detailed_analysis, client=None):
     """Extract high-revenue customer segments from detailed analysis."""
-    try:
-        summary_prompt = """Extract and analyze the customer segments that contribute to the top 80% of total revenue potential.
-
-For each segment, provide realistic and well-researched metrics:
-
-1. Segment Name/Title (be specific about the demographic)
-
-2. Revenue Metrics (all numbers must be justified):
-   - Average Purchase Value:
-     * Base this on actual market prices
-     * Consider regional variations
-     * Account for typical discounts/promotions
-   
-   - Annual Purchase Frequency:
-     * Use realistic consumer behavior patterns
-     * Consider product lifecycle
-     * Account for seasonal variations
-   
-   - Segment Size:
-     * Base on demographic data
-     * Consider market penetration rates
-     * Account for geographic limitations
-   
-   - Total Annual Revenue Potential:
-     * Calculate conservatively
-     * Show clear multiplication steps
-     * Round down for safety
-
-3. Value Proposition:
-   - Clear rationale for revenue estimates
-   - Specific pain points addressed
-   - Competitive advantages
-   - Market positioning
+    from google.genai.types import Tool, GenerateContentConfig, GoogleSearch
 
-Format each segment EXACTLY as follows, with NO introductory text:
-[Segment Name - Primary Demographic]
-Revenue Potential: $X million/year (show calculation)
-- Avg Purchase: $X (reference similar products)
-- Frequency: X purchases/year (justify with behavior patterns)
-- Segment Size: X customers (cite demographic data)
-[Three-line description including:
- - Value proposition
- - Revenue justification
- - Market positioning]
-
-[Next Segment]
-...etc.
-
-Important:
-- Order segments by revenue potential (highest to lowest)
-- Only include segments that together make up 80% of total revenue
-- Do NOT include any introductory text or summary before the segments
-- Start DIRECTLY with the first segment in [brackets]
-- Ensure all numbers are realistic and conservative
-
-Here's the analysis:
-""" + detailed_analysis
+    try:
+        summary_prompt = get_prompt('revenue_segments').render(analysis=detailed_analysis)
 
         # Get summary with grounding
         summary_response = client.models.generate_content(
@@ -80,8 +28,11 @@ Here's the analysis:
         except:
             pass
 
+        segments_text = summary_response.candidates[0].content.parts[0].text
+
         return {
-            "segments": summary_response.candidates[0].content.parts[0].text,
+            "segments": segments_text,
+            "parsed_segments": parse_segments(segments_text),
             "grounding_data": grounding_data
         }, None
 
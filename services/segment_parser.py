@@ -0,0 +1,108 @@
+import re
+
+METRIC_PATTERNS = {
+    'revenue_potential': re.compile(r'^revenue potential\s*:\s*(.*)$', re.IGNORECASE),
+    'avg_purchase': re.compile(r'^avg(?:\.|erage)? purchase(?: value)?\s*:\s*(.*)$', re.IGNORECASE),
+    'frequency': re.compile(r'^(?:annual )?(?:purchase )?frequency\s*:\s*(.*)$', re.IGNORECASE),
+    'segment_size': re.compile(r'^segment size\s*:\s*(.*)$', re.IGNORECASE)
+}
+
+
+def _bracket_groups(text):
+    """Split text into ('text', str) and ('group', str) tokens on balanced bracket groups.
+
+    Only groups that open a line (ignoring markdown emphasis) count; brackets
+    inside a line, such as "$20 [estimate]", stay part of the text.
+    """
+    tokens = []
+    depth = 0
+    start = 0
+    text_start = 0
+    for index, char in enumerate(text):
+        if char == '[':
+            if depth == 0:
+                line_prefix = text[text.rfind('\n', 0, index) + 1:index]
+                if line_prefix.strip(' \t*#') != '':
+                    continue
+                tokens.append(('text', text[text_start:index]))
+                start = index + 1
+            depth += 1
+        elif char == ']' and depth > 0:
+            depth -= 1
+            if depth == 0:
+                tokens.append(('group', text[start:index]))
+                text_start = index + 1
+    # An unclosed bracket is treated as plain text
+    tokens.append(('text', text[start - 1 if depth else text_start:]))
+    return tokens
+
+
+def _parse_metrics(details):
+    """Pull the revenue figures out of a segment's body lines."""
+    metrics = {key: '' for key in METRIC_PATTERNS}
+    for line in details.splitlines():
+        line = line.strip().lstrip('-*• ').replace('**', '').strip()
+        for key, pattern in METRIC_PATTERNS.items():
+            match = pattern.match(line)
+            if match and not metrics[key]:
+                metrics[key] = match.group(1).strip()
+                break
+    return metrics
+
+
+def _make_segment(name, details, value_proposition):
+    return {
+        'name': name.replace('*', '').strip(),
+        **_parse_metrics(details),
+        'details': details.strip().strip('*').strip(),
+        'value_proposition': value_proposition.strip()
+    }
+
+
+def parse_segments(segments_text):
+    """Parse the revenue segments text into a list of segment records.
+
+    The model is asked for blocks of the form
+
+        [Segment Name - Primary Demographic]
+        Revenue Potential: ...
+        - Avg Purchase: ...
+        - Frequency: ...
+        - Segment Size: ...
+        [Value proposition description]
+
+    Each record has name, revenue_potential, avg_purchase, frequency,
+    segment_size, details (the raw body) and value_proposition. Brackets are
+    matched with nesting, so brackets inside a description do not start a new
+    segment.
+    """
+    if not segments_text:
+        return []
+
+    segments = []
+    name = None
+    details = ''
+    for kind, value in _bracket_groups(segments_text):
+        if kind == 'text':
+            if name is not None:
+                details += value
+            continue
+
+        if name is None:
+            name = value
+            details = ''
+        elif details.strip() or '\n' in value.strip():
+            # A bracket after the body (or a multi-line one) is the value proposition
+            segments.append(_make_segment(name, details, value))
+            name = None
+            details = ''
+        else:
+            # Two headers in a row: the previous segment had no body
+            segments.append(_make_segment(name, details, ''))
+            name = value
+            details = ''
+
+    if name is not None:
+        segments.append(_make_segment(name, details, ''))
+
+    return [segment for segment in segments if segment['name']]
@@ -0,0 +1,156 @@
+import hashlib
+import re
+import threading
+from functools import lru_cache
+
+NUM_PERMUTATIONS = 128
+SHINGLE_SIZE = 5
+_PRIME = (1 << 31) - 1
+
+
+@lru_cache(maxsize=None)
+def _permutation_coefficients(name):
+    # Derived from fixed hashes rather than a seeded RNG: signatures are persisted,
+    # so the permutations must never change between releases
+    import numpy as np
+    return np.array([
+        int.from_bytes(hashlib.sha256(f"minhash:{name}:{index}".encode()).digest()[:8], 'little') % (_PRIME - 1) + 1
+        for index in range(NUM_PERMUTATIONS)
+    ], dtype=np.uint64)
+
+
+def normalize_text(text):
+    """Lowercase and drop punctuation so formatting changes do not count as differences."""
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', text.lower())).strip()
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Character n-grams of the normalized text."""
+    text = normalize_text(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[index:index + size] for index in range(len(text) - size + 1)}
+
+
+def minhash_signature(text):
+    """MinHash signature (NUM_PERMUTATIONS uint32 values) of a text, or None for empty text.
+
+    The fraction of equal positions in two signatures estimates the Jaccard
+    similarity of the texts' shingle sets.
+    """
+    # NumPy is imported on first use to keep it out of startup
+    import numpy as np
+
+    grams = shingles(text)
+    if not grams:
+        return None
+    a, b = _permutation_coefficients('a'), _permutation_coefficients('b')
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=4).digest(), 'little') for gram in grams),
+        dtype=np.uint64, count=len(grams)
+    )
+    # (a * h + b) mod p for every permutation and shingle stays below 2**63
+    return ((a[:, None] * hashes[None, :] + b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def _popcount64(values):
+    import numpy as np
+    return np.unpackbits(values.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+class SimilarityIndex:
+    """Near-duplicate lookup over previously analyzed inputs.
+
+    Text is compared by MinHash signature and images by the Hamming distance
+    of their perceptual hashes; a match needs the same kinds of input, a text
+    similarity of at least threshold and an image distance of at most
+    max_image_distance bits. Entries are persisted in the store (CacheService)
+    and mirrored into NumPy arrays, refreshed incrementally so entries added
+    by other processes are picked up; a lookup is one vectorized scan.
+    """
+
+    def __init__(self, store, threshold=0.85, max_image_distance=4):
+        self.store = store
+        self.threshold = threshold
+        self.max_image_distance = max_image_distance
+        self._query_hashes = []
+        # NumPy arrays, created by the first _refresh
+        self._signatures = None
+        self._has_text = None
+        self._phashes = None
+        self._has_image = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def add(self, query_hash, text=None, image_phash=None):
+        """Index an analyzed input under its query hash."""
+        signature = minhash_signature(text) if text else None
+        if signature is None and not image_phash:
+            return
+        self.store.add_similarity_entry(
+            query_hash,
+            signature.tobytes() if signature is not None else None,
+            image_phash
+        )
+
+    def find(self, text=None, image_phash=None):
+        """Return (query_hash, similarity) of the closest prior input above the thresholds, or None."""
+        signature = minhash_signature(text) if text else None
+        if signature is None and not image_phash:
+            return None
+
+        self._refresh()
+        import numpy as np
+        with self._lock:
+            if not self._query_hashes:
+                return None
+            candidates = self._has_text == (signature is not None)
+            candidates &= self._has_image == bool(image_phash)
+            scores = np.ones(len(self._query_hashes))
+
+            if signature is not None:
+                text_similarity = (self._signatures == signature).mean(axis=1)
+                candidates &= text_similarity >= self.threshold
+                scores = np.minimum(scores, text_similarity)
+            if image_phash:
+                distance = _popcount64(self._phashes ^ np.uint64(int(image_phash, 16)))
+                candidates &= distance <= self.max_image_distance
+                scores = np.minimum(scores, 1 - distance / 64)
+
+            if not candidates.any():
+                return None
+            scores = np.where(candidates, scores, -1.0)
+            # Prefer the most recent entry among equally similar ones
+            best = len(scores) - 1 - int(np.argmax(scores[::-1]))
+            return self._query_hashes[best], float(scores[best])
+
+    def _refresh(self):
+        """Load entries added to the store since the last refresh."""
+        import numpy as np
+        with self._lock:
+            if self._signatures is None:
+                self._signatures = np.zeros((0, NUM_PERMUTATIONS), dtype=np.uint32)
+                self._has_text = np.zeros(0, dtype=bool)
+                self._phashes = np.zeros(0, dtype=np.uint64)
+                self._has_image = np.zeros(0, dtype=bool)
+            rows = self.store.get_similarity_entries(after_id=self._last_id)
+            if not rows:
+                return
+            signatures = np.zeros((len(rows), NUM_PERMUTATIONS), dtype=np.uint32)
+            phashes = np.zeros(len(rows), dtype=np.uint64)
+            has_text = np.zeros(len(rows), dtype=bool)
+            has_image = np.zeros(len(rows), dtype=bool)
+            for index, row in enumerate(rows):
+                if row['text_signature']:
+                    signatures[index] = np.frombuffer(row['text_signature'], dtype=np.uint32)
+                    has_text[index] = True
+                if row['image_phash']:
+                    phashes[index] = int(row['image_phash'], 16)
+                    has_image[index] = True
+
+            self._query_hashes.extend(row['query_hash'] for row in rows)
+            self._signatures = np.concatenate([self._signatures, signatures])
+            self._phashes = np.concatenate([self._phashes, phashes])
+            self._has_text = np.concatenate([self._has_text, has_text])
+            self._has_image = np.concatenate([self._has_image, has_image])
+            self._last_id = rows[-1]['id']
@@ -0,0 +1,5 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app"""
+import os
+from app import create_app
+
+app = create_app(warm=os.getenv('APP_WARM_IMPORTS', '1').lower() not in ('0', 'false', 'no'))